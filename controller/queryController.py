@@ -9,6 +9,7 @@ from uvicorn import Config
 
 from addressSearch.entrypoint.applicationStarter import serviceApplication
 from addressSearch.enums.dbOperator import RestRet
+from addressSearch.es.elasticsearchManger import ElasticsearchManger
 
 # 在这里导入自己的serviceApplication实例
 
@@ -55,6 +56,16 @@ async def limit_concurrency(request: Request, call_next):
     return response
 
 
+@rest_app.on_event("shutdown")
+async def close_async_clients():
+    """
+    关闭异步请求用的 aiohttp session 和 AsyncElasticsearch 连接
+    """
+    aiModelService = serviceApplication.application_context.get_bean("aiModelService")
+    await aiModelService.close_async()
+    await ElasticsearchManger.close_async()
+
+
 @rest_app.exception_handler(OSError)
 async def handle_os_error(request, exc):
     """
@@ -64,14 +75,20 @@ async def handle_os_error(request, exc):
     return JSONResponse(status_code=500, content={"message": "Internal server error"})
 
 
-async def generate_user_result(result):
-    del_keys = []
-    for k in result.keys():
-        if (str(k).startswith("fir_") or str(k).startswith("mid_") or str(k).startswith("last_") or
-                str(k).startswith("building_number")):
-            del_keys.append(k)
-    for k in del_keys:
-        result.pop(k)
+def _cut_address(address_string):
+    addressParseService = serviceApplication.application_context.get_bean("addressParseService")
+    lacModelManageService = serviceApplication.application_context.get_bean("lacModelManageService")
+
+    with lacModelManageService as model:
+        return addressParseService.cutOnly(model, address_string)
+
+
+def _cut_address_batch(address_strings):
+    addressParseService = serviceApplication.application_context.get_bean("addressParseService")
+    lacModelManageService = serviceApplication.application_context.get_bean("lacModelManageService")
+
+    with lacModelManageService as model:
+        return addressParseService.cut_batch(model, address_strings)
 
 
 # ================================================================================
@@ -91,17 +108,45 @@ async def cutAddress(request: Request):
     address_string = list(jsonRequest.values())[0]
 
     try:
-        addressParseService = serviceApplication.application_context.get_bean("addressParseService")
-        lacModelManageService = serviceApplication.application_context.get_bean("lacModelManageService")
-
-        with lacModelManageService as model:
-            cut_list = addressParseService.cutOnly(model, address_string)
+        # LAC分词是CPU计算, 放到线程池里, 不阻塞事件循环
+        cut_list = await asyncio.get_running_loop().run_in_executor(None, _cut_address, address_string)
 
         return {key: cut_list, "code": RestRet.SUCCEED.value, "msg": None}
     except Exception as e:
         return {key: [], "code": RestRet.FAILED.value, "msg": str(e)}
 
 
+@rest_app.post("/cutAddressBatch")
+async def cutAddressBatch(request: Request):
+    """
+    参数格式
+    {
+        "1": "无锡市惠山区洛社镇五秦村强巷52号",
+        "2": "无锡市新吴区硕放街道南开路1号"
+    }
+
+    :param request:
+    :return:
+    """
+    jsonRequest = await request.json()
+    if not isinstance(jsonRequest, dict):
+        return {"data": {}, "code": RestRet.FAILED.value, "msg": "参数必须是 {key: 地址} 格式"}
+
+    # 不是字符串或者为空的直接返回空结果, 不交给分词
+    data = {key: [] for key in jsonRequest.keys()}
+    keys = [key for key, value in jsonRequest.items() if isinstance(value, str) and value.strip() != ""]
+    address_strings = [jsonRequest[key] for key in keys]
+
+    try:
+        if len(address_strings) > 0:
+            cut_lists = await asyncio.get_running_loop().run_in_executor(None, _cut_address_batch, address_strings)
+            data.update(zip(keys, cut_lists))
+
+        return {"data": data, "code": RestRet.SUCCEED.value, "msg": None}
+    except Exception as e:
+        return {"data": {}, "code": RestRet.FAILED.value, "msg": str(e)}
+
+
 @rest_app.post("/searchByAddress")
 async def searchByAddress(request: Request):
     """
@@ -118,11 +163,10 @@ async def searchByAddress(request: Request):
     address_string = list(jsonRequest.values())[0]
 
     esSearchService = serviceApplication.application_context.get_bean("esSearchService")
+    # 解析出的分段字段不返回给用户
+    esSearchService.set_source_profile("user")
 
-    succeed, result = esSearchService.run_address_search_by_score(address_string)
-
-    if succeed:
-        await generate_user_result(result)
+    succeed, result = await esSearchService.run_address_search_by_score_async(address_string)
 
     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
@@ -143,7 +187,7 @@ async def searchByAddressDev(request: Request):
     address_string = list(jsonRequest.values())[0]
 
     esSearchService = serviceApplication.application_context.get_bean("esSearchService")
-    succeed, result = esSearchService.run_address_search_by_score(address_string)
+    succeed, result = await esSearchService.run_address_search_by_score_async(address_string)
 
     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
@@ -165,9 +209,8 @@ async def searchByAddressEx(request: Request):
 
     esSearchService = serviceApplication.application_context.get_bean("esSearchService")
     esSearchService.set_return_multi()
-    succeed, result = esSearchService.run_address_search(address_string)
-    if not succeed:
-        succeed, result = esSearchService.run_address_search(address_string, True)
+    esSearchService.set_source_profile("user")
+    succeed, result = await esSearchService.run_address_search_async(address_string)
 
     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
@@ -191,9 +234,8 @@ async def searchByPoint(request: Request):
     buff_distance = 40 if "buff_distance" not in jsonRequest else jsonRequest["buff_distance"]
 
     esSearchService = serviceApplication.application_context.get_bean("esSearchService")
-    succeed, result = esSearchService.run_search_by_point(points_string, buff_distance)
-    if succeed:
-        await generate_user_result(result)
+    esSearchService.set_source_profile("user")
+    succeed, result = await esSearchService.run_search_by_point_async(points_string, buff_distance)
 
     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
@@ -218,7 +260,7 @@ async def searchByPointDev(request: Request):
     buff_distance = 40 if "buff_distance" not in jsonRequest else jsonRequest["buff_distance"]
 
     esSearchService = serviceApplication.application_context.get_bean("esSearchService")
-    succeed, result = esSearchService.run_search_by_point(points_string, buff_distance)
+    succeed, result = await esSearchService.run_search_by_point_async(points_string, buff_distance)
     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
 
@@ -242,6 +284,22 @@ async def searchByPointDev(request: Request):
 #     return _make_rest_result(key, result, "未找到" if not succeed else None)
 
 
+@rest_app.post("/parseMetrics")
+async def parseMetrics():
+    """
+    地址解析各步骤的耗时统计
+    """
+    parseMetricsService = serviceApplication.application_context.get_bean("parseMetricsService")
+    addressParseService = serviceApplication.application_context.get_bean("addressParseService")
+    data = parseMetricsService.snapshot()
+    data["parse_cache"] = addressParseService.get_cache_stats()
+    return {
+        "data": data,
+        "code": RestRet.SUCCEED.value,
+        "msg": "succeed"
+    }
+
+
 @rest_app.post("/reset")
 async def addressReset():
     """
@@ -300,6 +358,7 @@ def start_rest_service():
     port = applicationEnvironment.get("project.http.rest_port")
     # uvicorn.run(rest_app, host="0.0.0.0", port=port, reload=False, workers=8)
 
-    config = Config(app=rest_app, lifespan='off', host="0.0.0.0", port=port, reload=False)
+    # 开启 lifespan, 停止时才会调用 shutdown 事件
+    config = Config(app=rest_app, lifespan='on', host="0.0.0.0", port=port, reload=False)
     server = uvicorn.Server(config=config)
     server.run()
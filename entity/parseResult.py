@@ -0,0 +1,80 @@
+from addressSearch.es.schemas import es_schema_field_building_number, es_schema_fields_fir, es_schema_fields_main, \
+    es_schema_fields_mid, es_schema_fields_last
+
+
+class ParseResult:
+    """
+    地址解析结果。 fir / mid / last 按顺序放在列表里，不再生成 "fir_1" 这种key的字典
+    """
+    __slots__ = ("succeed", "region", "street", "fir", "main", "mid", "last", "building_number")
+
+    def __init__(self, succeed=False, region=None, street=None, fir=None, main=None, mid=None, last=None,
+                 building_number=0):
+        self.succeed = succeed
+        self.region = region
+        self.street = street
+        # 主体前的部分
+        self.fir = fir if fir is not None else []
+        # 主体
+        self.main = main
+        # 主体后 到 楼栋之间的部分
+        self.mid = mid if mid is not None else []
+        # last部分
+        self.last = last if last is not None else []
+        self.building_number = building_number
+
+    @classmethod
+    def fail(cls):
+        return cls(False)
+
+    def copy(self):
+        return ParseResult(self.succeed, self.region, self.street, list(self.fir), self.main, list(self.mid),
+                           list(self.last), self.building_number)
+
+    def is_overflow(self):
+        """
+        解析出的长度是否超过es中的字段数量
+        """
+        return (len(self.fir) > len(es_schema_fields_fir)
+                or (1 if self.main is not None else 0) > len(es_schema_fields_main)
+                or len(self.mid) > len(es_schema_fields_mid)
+                or len(self.last) > len(es_schema_fields_last))
+
+    def __iter__(self):
+        """
+        兼容原来 8 个元素的返回值: succeed, region, street, first, main, mid, last, build_number
+        """
+        if not self.succeed:
+            return iter((False, self.region, self.street, None, None, None, None, None))
+        return iter((self.succeed, self.region, self.street, self.first_section(), self.main_section(),
+                     self.mid_section(), self.last_section(), self.building_number_section()))
+
+    @staticmethod
+    def _section(prefix, values):
+        return {prefix + str(i + 1): v for i, v in enumerate(values)}
+
+    def first_section(self):
+        return self._section("fir_", self.fir)
+
+    def main_section(self):
+        return {"f_main": self.main} if self.main is not None else {}
+
+    def mid_section(self):
+        return self._section("mid_", self.mid)
+
+    def last_section(self):
+        return self._section("last_", self.last)
+
+    def building_number_section(self):
+        return {es_schema_field_building_number: self.building_number}
+
+    def to_row(self):
+        """
+        转成解析表的一行
+        """
+        row = self.first_section()
+        row.update(self.main_section())
+        row.update(self.mid_section())
+        row.update(self.last_section())
+        row.update(self.building_number_section())
+        return row
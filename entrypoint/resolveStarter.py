@@ -1,4 +1,6 @@
+import multiprocessing
 import os
+import queue
 import sys
 import time
 
@@ -10,6 +12,7 @@ sys.path.append(root_model_path)
 
 from time import sleep
 from pySimpleSpringFramework.spring_core.applicationStarter import ApplicationStarter
+from pySimpleSpringFramework.spring_core.log import log
 from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import ComponentScan, ConfigDirectories
 from addressSearch.utils.commonTool import CommonTool
 from datetime import datetime
@@ -55,6 +58,10 @@ class ServiceApplication(ApplicationStarter):
         service = self.application_context.get_bean("postDataToEsService")
         service.start_by_thread_df(df)
 
+    def rebuild_es(self):
+        service = self.application_context.get_bean("postDataToEsService")
+        return service.rebuild()
+
     def main(self):
         self._application_environment = self.application_context.get_bean("applicationEnvironment")
         self._address_mapping = self.application_context.get_bean("addressMapping")
@@ -66,15 +73,200 @@ class ServiceApplication(ApplicationStarter):
         self._address_parsed_table = self._configService.get_addr_cnf("data_table_parsed")
 
 
-def task_parse_limit(df):
+def resolve_worker(worker_idx, task_queue, result_queue):
+    """
+    常驻的解析进程。 ServiceApplication 只启动一次，之后一直从队列里取数据解析
+    """
     app = ServiceApplication()
     app.run()
-    app.do_parse_table_limit(df)
+    result_queue.put(("ready", worker_idx, None))
 
+    while True:
+        task = task_queue.get()
+        # None 表示退出
+        if task is None:
+            break
 
-def parse_process_limit(app):
-    executorTaskManager = app.application_context.get_bean("executorTaskManager")
-    process_count = executorTaskManager.core_num
+        task_id, df = task
+        result_queue.put(("start", worker_idx, task_id))
+        try:
+            app.do_parse_table_limit(df)
+            result_queue.put(("done", worker_idx, task_id))
+        except Exception as e:
+            log.error("resolve_worker => " + str(e))
+            result_queue.put(("failed", worker_idx, task_id))
+        del df
+
+
+class WorkerPoolError(RuntimeError):
+    """
+    解析进程反复启动失败
+    """
+    pass
+
+
+class ResolveWorkerPool:
+    """
+    常驻的解析进程池, 避免每批数据都重新启动一次 ServiceApplication（扫描组件、加载配置、字典和模型）
+    """
+    __POLL_SECONDS = 5
+    __JOIN_SECONDS = 10
+
+    def __init__(self, process_count, timeout_seconds=3600, max_restarts=3):
+        """
+        :param timeout_seconds: 一次 run_chunks 最长等待时间
+        :param max_restarts: 一个解析进程连续重启（重启后没有启动成功就又退出）的最大次数
+        """
+        self._process_count = process_count
+        self._timeout_seconds = timeout_seconds
+        self._max_restarts = max_restarts
+        self._task_queue = multiprocessing.Queue()
+        self._result_queue = multiprocessing.Queue()
+        self._workers = {}
+        # 进程编号 -> 正在处理的任务
+        self._running = {}
+        # 进程编号 -> 连续重启次数, 进程发出 ready 后清零
+        self._restart_counts = {}
+        self._task_id = 0
+
+    @property
+    def process_count(self):
+        return self._process_count
+
+    def start(self):
+        for worker_idx in range(self._process_count):
+            self._start_worker(worker_idx)
+
+    def _start_worker(self, worker_idx):
+        process = multiprocessing.Process(target=resolve_worker,
+                                          args=(worker_idx, self._task_queue, self._result_queue),
+                                          daemon=True)
+        process.start()
+        self._workers[worker_idx] = process
+
+    def check_health(self):
+        """
+        检查解析进程是否还活着，挂掉的重新启动
+        :return: 挂掉的进程正在处理的任务。 这些数据没有改状态，下次还会被查出来重新解析
+        """
+        lost_tasks = []
+        for worker_idx, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+
+            task_id = self._running.pop(worker_idx, None)
+            if task_id is not None:
+                lost_tasks.append(task_id)
+
+            restart_count = self._restart_counts.get(worker_idx, 0) + 1
+            if restart_count > self._max_restarts:
+                raise WorkerPoolError(f"解析进程 {worker_idx} 连续重启 {self._max_restarts} 次仍然失败")
+            self._restart_counts[worker_idx] = restart_count
+            log.error(f"解析进程 {worker_idx} 已退出(exitcode={process.exitcode}), 第 {restart_count} 次重新启动")
+            self._start_worker(worker_idx)
+        return lost_tasks
+
+    def _drain_tasks(self):
+        """
+        取出还没有被解析进程拿走的任务
+        """
+        drained = []
+        while True:
+            try:
+                task = self._task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                drained.append(task[0])
+        return drained
+
+    def _collect_results(self):
+        """
+        读出结果队列里还没处理的消息, 更新正在处理的任务
+        """
+        while True:
+            try:
+                status, worker_idx, task_id = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                break
+            if status == "ready":
+                self._restart_counts[worker_idx] = 0
+            elif status == "start":
+                self._running[worker_idx] = task_id
+            elif status in ("done", "failed"):
+                self._running.pop(worker_idx, None)
+
+    def _restart_running_workers(self):
+        """
+        结束并重新启动还在处理任务的解析进程。
+        这些任务的数据没有改状态, 不结束的话下一轮会把同样的数据再分给别的进程, 同时解析两次
+        :return: 被中止的任务
+        """
+        self._collect_results()
+        stopped = []
+        for worker_idx, task_id in list(self._running.items()):
+            process = self._workers.get(worker_idx)
+            if process is not None and process.is_alive():
+                process.terminate()
+                process.join(timeout=self.__JOIN_SECONDS)
+            log.error(f"解析进程 {worker_idx} 的任务 {task_id} 没有完成, 结束并重新启动")
+            self._start_worker(worker_idx)
+            stopped.append(task_id)
+        self._running.clear()
+        return stopped
+
+    def run_chunks(self, ls_df):
+        """
+        把数据分给解析进程，等待全部完成。
+        超时或者解析进程反复挂掉时, 取消还没开始的任务, 结束正在处理任务的进程并抛出异常。
+        没完成的数据没有改状态，下次还会被查出来重新解析
+        """
+        pending = set()
+        for df in ls_df:
+            self._task_id += 1
+            self._task_queue.put((self._task_id, df))
+            pending.add(self._task_id)
+
+        deadline = time.time() + self._timeout_seconds
+        try:
+            while len(pending) > 0:
+                if time.time() > deadline:
+                    raise TimeoutError(f"等待解析进程超过 {self._timeout_seconds} 秒")
+
+                try:
+                    status, worker_idx, task_id = self._result_queue.get(timeout=self.__POLL_SECONDS)
+                except queue.Empty:
+                    for task_id in self.check_health():
+                        pending.discard(task_id)
+                    continue
+
+                if status == "ready":
+                    self._restart_counts[worker_idx] = 0
+                elif status == "start":
+                    self._running[worker_idx] = task_id
+                elif status in ("done", "failed"):
+                    self._running.pop(worker_idx, None)
+                    pending.discard(task_id)
+        except Exception:
+            # 还在队列里的任务不再执行, 已经被拿走但没有结果的任务当作失败
+            cancelled = self._drain_tasks()
+            stopped = self._restart_running_workers()
+            log.error(f"run_chunks 中止, 取消的任务: {cancelled}, 中止的任务: {stopped}, "
+                      f"未完成的任务: {sorted(pending)}")
+            raise
+
+    def close(self):
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for process in self._workers.values():
+            process.join(timeout=self.__JOIN_SECONDS)
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
+
+
+def parse_process_limit(app, worker_pool):
+    process_count = worker_pool.process_count
 
     applicationEnvironment = app.application_context.get_bean("applicationEnvironment")
     min_size = applicationEnvironment.get("project.tables.batch_size")
@@ -89,14 +281,9 @@ def parse_process_limit(app):
     if data_count <= limit_size:
         process_count = 1
 
-    futures = []
     ls_df = CommonTool.split_dataframe(data, process_count)
-    for df in ls_df:
-        # print(start, end)
-        future = executorTaskManager.submit(task_parse_limit, True, None, df)
-        futures.append(future)
     print(f"\n============ 开始分词解析, 当前需要处理数量: {data_count} , 请等待 ============\n")
-    executorTaskManager.waitUntilComplete(futures)
+    worker_pool.run_chunks(ls_df)
     del ls_df
     return data_count
 
@@ -130,13 +317,24 @@ if __name__ == '__main__':
 
     serviceApplication.clearLacCustomDict()
 
+    # 全量重建es索引, 完成后切换别名
+    if "--rebuild-es" in sys.argv[1:]:
+        serviceApplication.rebuild_es()
+
+    executorTaskManager = serviceApplication.application_context.get_bean("executorTaskManager")
+    resolveWorkerPool = ResolveWorkerPool(executorTaskManager.core_num)
+    resolveWorkerPool.start()
+
     count_parsed_count = 0
     count_to_es_count = 0
     while True:
         start_time = time.time()  # 获取当前时间
         try:
+            # 检查解析进程
+            resolveWorkerPool.check_health()
+
             # 分词和解析
-            count_parsed = parse_process_limit(serviceApplication)
+            count_parsed = parse_process_limit(serviceApplication, resolveWorkerPool)
             if count_parsed > 0:
                 print("=========== 分词和解析完成, 准备写入es ===========")
 
@@ -160,5 +358,11 @@ if __name__ == '__main__':
                 print(f"本次耗时: {elapsed_time:.1f} 秒")
 
             sleep(5)
+        except WorkerPoolError as e:
+            # 解析进程反复启动失败, 不再重试
+            log.error("解析进程池不可用, 退出 => " + str(e))
+            break
         except Exception as e:
             print(str(e))
+
+    resolveWorkerPool.close()
@@ -1,22 +1,37 @@
+import asyncio
 import threading
 import time
 from datetime import datetime
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch.helpers import streaming_bulk
 from pySimpleSpringFramework.spring_core.log import log
 
 
 class ElasticsearchManger:
     __CONN_TIME_OUT = 120  # 单位秒
+    __BULK_CHUNK_SIZE = 1000  # 每批最多条数
+    __BULK_CHUNK_BYTES = 10 * 1024 * 1024  # 每批最多字节数
     __local_obj = threading.local()
 
-    def __init__(self, indexName, indexSchema, ip, port, username=None, password=None):
+    # 进程内共享的连接, 每个节点一个连接池（长连接, 多个节点轮询）
+    __POOL_MAXSIZE = 50  # 每个节点的最大连接数
+    __shared_conns = {}
+    __shared_lock = threading.Lock()
+    # 异步连接, 每个事件循环一个
+    __async_conns = {}
+
+    def __init__(self, indexName, indexSchema, ip, port, username=None, password=None, shared=False):
+        """
+        :param shared: True 则使用进程内共享的连接, close() 不会关闭它
+        """
         self.__indexName = indexName
         self._ip = ip
         self._port = port
         self._username = username if username != "" else None
         self._password = password if password != "" else None
         self.__indexSchema = indexSchema
+        self._shared = shared
 
     @property
     def index_name(self):
@@ -45,13 +60,144 @@ class ElasticsearchManger:
             conn.delete(index=self.__indexName, id=dataId)
         self.__local_obj.last_do_time = time.time()
 
+    def bulk(self, actions, chunk_size=None, max_chunk_bytes=None):
+        """
+        批量新增/删除, 按条数和字节数分批通过 _bulk 发给es
+        :param actions: (op, dataId, data) 的可迭代对象, op 为 "index" 或 "delete", delete 时 data 为 None
+        :param chunk_size: 每批最多条数
+        :param max_chunk_bytes: 每批最多字节数
+        :return: 失败的 dataId 列表。 连不上es时抛出 ConnectionError
+        """
+        data_ids = {}
+
+        def make_actions():
+            for op, dataId, data in actions:
+                data_ids[str(dataId)] = dataId
+                action = {"_op_type": op, "_index": self.__indexName, "_id": dataId}
+                if op == "index":
+                    action["_source"] = data
+                yield action
+
+        conn = self._get_conn()
+        if conn is None:
+            # 连不上es时整批不处理, 调用方不改状态, 下次重新处理
+            raise ConnectionError("es.bulk: 没有可用的es连接")
+
+        failed_ids = []
+        for ok, item in streaming_bulk(conn, make_actions(),
+                                       chunk_size=chunk_size or self.__BULK_CHUNK_SIZE,
+                                       max_chunk_bytes=max_chunk_bytes or self.__BULK_CHUNK_BYTES,
+                                       raise_on_error=False,
+                                       raise_on_exception=False):
+            op, result = item.copy().popitem()
+            # 删除不存在的文档不算失败
+            if ok or (op == "delete" and result.get("status") == 404):
+                continue
+            dataId = data_ids.get(str(result.get("_id")), result.get("_id"))
+            log.error(f"es.bulk {op} error:{str(result.get('error'))}, dataId={str(dataId)}")
+            failed_ids.append(dataId)
+        self.__local_obj.last_do_time = time.time()
+        return failed_ids
+
     def put_script(self, script_name, script_content):
         conn = self._get_conn()
         response = conn.put_script(id=script_name, body=script_content)
         self.__local_obj.last_do_time = time.time()
         return response.get('acknowledged')
 
+    def get_script(self, script_name):
+        """
+        :return: es中已有脚本的内容, 没有则返回None
+        """
+        conn = self._get_conn()
+        try:
+            response = conn.get_script(id=script_name)
+        except NotFoundError:
+            return None
+        finally:
+            self.__local_obj.last_do_time = time.time()
+        if not response.get("found", True):
+            return None
+        return response.get("script")
+
+    def __hosts(self):
+        # ip 可以配置多个节点, 逗号分隔
+        return [{"host": ip.strip(), "port": int(self._port)} for ip in str(self._ip).split(",") if ip.strip() != ""]
+
+    def __shared_conn(self):
+        key = (str(self._ip), int(self._port), self._username)
+        es_conn = self.__shared_conns.get(key)
+        if es_conn is not None:
+            return es_conn
+
+        with self.__shared_lock:
+            es_conn = self.__shared_conns.get(key)
+            if es_conn is None:
+                kwargs = {"maxsize": self.__POOL_MAXSIZE}
+                if self._username is not None and self._password is not None:
+                    kwargs["http_auth"] = (self._username, self._password)
+                es_conn = Elasticsearch(self.__hosts(), **kwargs)
+                self.__shared_conns[key] = es_conn
+        return es_conn
+
+    def __async_conn(self):
+        # 需要安装 elasticsearch[async]
+        from elasticsearch import AsyncElasticsearch
+
+        key = (str(self._ip), int(self._port), self._username, id(asyncio.get_running_loop()))
+        es_conn = self.__async_conns.get(key)
+        if es_conn is None:
+            kwargs = {"maxsize": self.__POOL_MAXSIZE}
+            if self._username is not None and self._password is not None:
+                kwargs["http_auth"] = (self._username, self._password)
+            es_conn = AsyncElasticsearch(self.__hosts(), **kwargs)
+            self.__async_conns[key] = es_conn
+        return es_conn
+
+    @classmethod
+    async def close_async(cls):
+        """
+        关闭当前事件循环的所有异步连接, 服务停止时调用
+        """
+        loop_id = id(asyncio.get_running_loop())
+        for key in [key for key in cls.__async_conns.keys() if key[-1] == loop_id]:
+            es_conn = cls.__async_conns.pop(key)
+            try:
+                await es_conn.close()
+            except Exception as e:
+                log.error("close async es connection error => " + str(e))
+
+    async def query_async(self, jsonQuery, filter_path=None):
+        try:
+            conn = self.__async_conn()
+            return await conn.search(body=jsonQuery, index=self.__indexName, filter_path=filter_path)
+        except Exception as e:
+            log.error(str(e))
+            return None
+
+    async def msearch_async(self, jsonQueries, filter_path=None):
+        """
+        和 msearch 一样, 异步
+        """
+        if len(jsonQueries) == 0:
+            return []
+        try:
+            body = []
+            for jsonQuery in jsonQueries:
+                body.append({"index": self.__indexName})
+                body.append(jsonQuery)
+            conn = self.__async_conn()
+            response = await conn.msearch(body=body, filter_path=self.__msearch_filter_path(filter_path))
+            responses = response.get("responses", [])
+            return [None if response is None or "error" in response else response for response in responses]
+        except Exception as e:
+            log.error(str(e))
+            return [None for _ in jsonQueries]
+
     def __conn(self):
+        if self._shared:
+            return self.__shared_conn()
+
         if hasattr(self.__local_obj, "es_conn") and self.__local_obj.es_conn is not None:
             if self.is_time_out():
                 self.close()
@@ -75,6 +221,9 @@ class ElasticsearchManger:
             conn.indices.create(index=index_name, body=self.__indexSchema)
 
     def close(self):
+        # 共享的连接由整个进程使用, 不关闭
+        if self._shared:
+            return
         try:
             if hasattr(self.__local_obj, "es_conn"):
                 self.__local_obj.es_conn.close()
@@ -99,17 +248,113 @@ class ElasticsearchManger:
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
+    def create_with_settings(self, index_name, settings):
+        """
+        用当前 schema 建索引, 并指定 settings（如重建时关闭刷新、不要副本）
+        """
+        conn = self._get_conn()
+        body = dict(self.__indexSchema)
+        body["settings"] = settings
+        conn.indices.create(index=index_name, body=body)
+        self.__local_obj.last_do_time = time.time()
+
+    def get_index_setting(self, index_name, setting_name, default=None):
+        """
+        :param setting_name: 如 number_of_replicas
+        """
+        conn = self._get_conn()
+        try:
+            response = conn.indices.get_settings(index=index_name, name="index." + setting_name)
+        except NotFoundError:
+            return default
+        finally:
+            self.__local_obj.last_do_time = time.time()
+        for index_settings in response.values():
+            return index_settings.get("settings", {}).get("index", {}).get(setting_name, default)
+        return default
+
+    def put_settings(self, index_name, settings):
+        conn = self._get_conn()
+        conn.indices.put_settings(index=index_name, body={"index": settings})
+        self.__local_obj.last_do_time = time.time()
+
+    def refresh(self, index_name):
+        conn = self._get_conn()
+        conn.indices.refresh(index=index_name)
+        self.__local_obj.last_do_time = time.time()
+
+    def force_merge(self, index_name, max_num_segments=1):
+        conn = self._get_conn()
+        conn.indices.forcemerge(index=index_name, max_num_segments=max_num_segments, request_timeout=3600)
+        self.__local_obj.last_do_time = time.time()
+
+    def get_alias_indices(self, alias):
+        """
+        :return: 别名指向的索引, 别名不存在则返回空列表
+        """
+        conn = self._get_conn()
+        try:
+            if not conn.indices.exists_alias(name=alias):
+                return []
+            return list(conn.indices.get_alias(name=alias).keys())
+        finally:
+            self.__local_obj.last_do_time = time.time()
+
+    def swap_alias(self, alias, index_name):
+        """
+        一次请求把别名切换到新索引（原子操作）。 如果别名的名字原来是个索引, 同时删掉这个索引
+        :return: 别名原来指向的索引
+        """
+        conn = self._get_conn()
+        old_indices = self.get_alias_indices(alias)
+        actions = [{"remove": {"index": old_index, "alias": alias}} for old_index in old_indices]
+        if len(old_indices) == 0 and conn.indices.exists(index=alias):
+            actions.append({"remove_index": {"index": alias}})
+        actions.append({"add": {"index": index_name, "alias": alias}})
+        conn.indices.update_aliases(body={"actions": actions})
+        self.__local_obj.last_do_time = time.time()
+        return old_indices
+
     def deleteIndex(self, index_name):
         conn = self._get_conn()
         if conn.indices.exists(index=index_name):
             conn.indices.delete(index=index_name)
         self.__local_obj.last_do_time = time.time()
 
-    def query(self, jsonQuery):
+    @staticmethod
+    def __msearch_filter_path(filter_path):
+        if filter_path is None:
+            return None
+        # 每个结果都保留 status, 没有命中的结果才不会被整个过滤掉, 保证和查询一一对应
+        return ["responses.status", "responses.error"] + ["responses." + path for path in filter_path]
+
+    def msearch(self, jsonQueries, filter_path=None):
+        """
+        多个查询一次请求发给es
+        :param jsonQueries:
+        :param filter_path: 每个结果里需要返回的部分, 如 ["hits.hits._id"]
+        :return: 和 jsonQueries 一一对应的结果, 失败的为None
+        """
+        if len(jsonQueries) == 0:
+            return []
+        try:
+            body = []
+            for jsonQuery in jsonQueries:
+                body.append({"index": self.__indexName})
+                body.append(jsonQuery)
+            conn = self._get_conn()
+            self.__local_obj.last_do_time = time.time()
+            responses = conn.msearch(body=body, filter_path=self.__msearch_filter_path(filter_path)).get("responses", [])
+            return [None if response is None or "error" in response else response for response in responses]
+        except Exception as e:
+            log.error(str(e))
+            return [None for _ in jsonQueries]
+
+    def query(self, jsonQuery, filter_path=None):
         try:
             conn = self._get_conn()
             self.__local_obj.last_do_time = time.time()
-            return conn.search(body=jsonQuery, index=self.__indexName)
+            return conn.search(body=jsonQuery, index=self.__indexName, filter_path=filter_path)
         except Exception as e:
             log.error(str(e))
             return None
@@ -28,6 +28,26 @@ es_schema_number_fields = [
     "roomno"
 ]
 
+# 搜索时按段匹配（从粗到细）: 行政区划、道路、兴趣点及门牌
+es_schema_search_segments = [
+    ["prov", "city", "district", "devzone", "town"],
+    ["community", "village_group", "road", "roadno", "intersection"],
+    ["poi", "subpoi", "houseno", "cellno", "floorno", "roomno"]
+]
+
+# 地址解析后的分段字段（解析表中的列）
+es_schema_field_building_number = "building_number"
+es_schema_fields_fir = ["fir_" + str(i) for i in range(1, 11)]
+es_schema_fields_main = ["f_main"]
+es_schema_fields_mid = ["mid_" + str(i) for i in range(1, 11)]
+es_schema_fields_last = ["last_" + str(i) for i in range(1, 11)]
+
+# 返回结果时 _source 的字段范围: user 不返回解析出的分段字段, dev 返回全部
+es_source_profiles = {
+    "user": {"excludes": ["fir_*", "mid_*", "last_*", "building_number*"]},
+    "dev": True
+}
+
 schemaMain = {
     "mappings": {
         "properties": {
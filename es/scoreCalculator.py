@@ -0,0 +1,159 @@
+import numpy as np
+
+from addressSearch.entity.parseResult import ParseResult
+from addressSearch.es.schemas import es_schema_field_building_number, es_schema_fields_fir, es_schema_fields_mid, \
+    es_schema_fields_last
+
+
+class ScoreCalculator:
+    """
+    es评分脚本 (scripts.SEARCH_SCORE_SCRIPT) 的本地实现, 一次给一批文档打分。
+    可以对es返回的结果在本地重新打分、排序，规则和脚本一致:
+        找到主体 50 分, fir 每个 5 分, mid 一共 20 分, last 每个 4 分, 全部匹配 100 分
+        每段的值比查询的多要减分, multi_region 时区、街道不一致各减 5 分
+    """
+    BASE_SCORE = 50
+    EVERY_SCORE_FIR = 5
+    MID_ALL_SCORE = 20
+    MID_1_FOUND_SCORE = 3
+    EVERY_SCORE_LAST = 4
+    DE_REGION_SCORE = -5.0
+    DE_STREET_SCORE = -5.0
+
+    def __init__(self, multi_region=False, region_field=None, street_field=None):
+        self._multi_region = multi_region
+        self._region_field = region_field
+        self._street_field = street_field
+
+    def _doc_fields(self):
+        fields = es_schema_fields_fir + es_schema_fields_mid + es_schema_fields_last + [es_schema_field_building_number]
+        if self._multi_region:
+            fields += [field for field in (self._region_field, self._street_field) if field is not None]
+        return fields
+
+    @staticmethod
+    def _doc_values(docs, fields):
+        """
+        一次取出所有文档要用的字段
+        :return: 文档数 x 字段数 的 (字符串矩阵, 是否有值的矩阵, 原始值矩阵)
+        """
+        raw = np.empty((len(docs), len(fields)), dtype=object)
+        raw[:] = [[doc.get(field) for field in fields] for doc in docs]
+        # None、空串、NaN(从解析表读出来的空值) 都算没有值, NaN 不等于自己
+        present = np.not_equal(raw, None) & np.not_equal(raw, "") & np.equal(raw, raw)
+        return raw.astype(str), present, raw
+
+    @staticmethod
+    def _contains(values, present, query_values):
+        """
+        矩阵中每个值是否在查询值里
+        """
+        if values.size == 0 or len(query_values) == 0:
+            return np.zeros(values.shape, dtype=bool)
+        return present & np.isin(values, [str(v) for v in query_values])
+
+    @staticmethod
+    def _de_score(values, present, value, de_score):
+        """
+        文档有这个字段且值不相等的减分
+        """
+        value = value if value is not None else ""
+        return np.where(present & (values != value), de_score, 0.0)
+
+    def _score_fir(self, values, present, query_values):
+        found_count = self._contains(values, present, query_values).sum(axis=1).astype(float)
+        contains_count = present.sum(axis=1).astype(float)
+
+        query_value_length = len(query_values)
+        score = found_count * self.EVERY_SCORE_FIR
+        score_de = np.where(query_value_length < contains_count,
+                            (query_value_length - contains_count) * self.EVERY_SCORE_FIR, 0.0)
+        return score, score_de, found_count
+
+    def _score_mid(self, values, present, query_values, doc_numbers, number_present, building_number):
+        contains_count = present.sum(axis=1).astype(float)
+
+        query_value_length = len(query_values)
+        score = np.zeros(len(values))
+        found_count = np.zeros(len(values))
+        # 只有1个值的时候比对楼栋号, 从解析表读出来的楼栋号可能是浮点数
+        if query_value_length == 1:
+            numbers = np.full(len(values), np.nan)
+            numbers[number_present] = doc_numbers[number_present].astype(float)
+            found = number_present & (np.trunc(numbers) == int(building_number))
+            score = np.where(found, float(self.MID_ALL_SCORE), 0.0)
+            found_count = found.astype(float)
+
+        if query_value_length > 1:
+            avg_score = self.MID_ALL_SCORE // query_value_length
+            # 第1个位置mid_1的值必须对应, 后面几个位置任意匹配
+            mid_1_found = present[:, 0] & (values[:, 0] == str(query_values[0]))
+            found_count = (mid_1_found.astype(float)
+                           + self._contains(values[:, 1:], present[:, 1:], query_values[1:]).sum(axis=1))
+            score = np.where(found_count == query_value_length, float(self.MID_ALL_SCORE),
+                             avg_score * found_count + np.where(mid_1_found, self.MID_1_FOUND_SCORE, 0))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score_de = np.where(query_value_length < contains_count,
+                                (query_value_length - contains_count) * (self.MID_ALL_SCORE / contains_count), 0.0)
+        return score, score_de, found_count
+
+    def _score_last(self, values, present, query_values):
+        found_count = self._contains(values, present, query_values).sum(axis=1).astype(float)
+        contains_count = present.sum(axis=1).astype(float)
+
+        score = found_count * self.EVERY_SCORE_LAST
+        score_de = np.where(len(query_values) < contains_count, float(-self.EVERY_SCORE_LAST), 0.0)
+        return score, score_de, found_count
+
+    def score(self, parse_result: ParseResult, docs):
+        """
+        :param parse_result: 查询地址的解析结果
+        :param docs: 文档 (es 的 _source) 列表
+        :return: 每个文档的分数
+        """
+        if len(docs) == 0:
+            return np.zeros(0)
+
+        fields = self._doc_fields()
+        values, present, raw = self._doc_values(docs, fields)
+
+        def columns(names):
+            idx = [fields.index(name) for name in names]
+            return values[:, idx], present[:, idx]
+
+        number_idx = fields.index(es_schema_field_building_number)
+        fir_score, fir_score_de, fir_found = self._score_fir(*columns(es_schema_fields_fir), parse_result.fir)
+        mid_score, mid_score_de, mid_found = self._score_mid(*columns(es_schema_fields_mid), parse_result.mid,
+                                                             raw[:, number_idx], present[:, number_idx],
+                                                             parse_result.building_number)
+        last_score, last_score_de, last_found = self._score_last(*columns(es_schema_fields_last), parse_result.last)
+
+        all_found_count = fir_found + mid_found + last_found
+        all_value_count = len(parse_result.fir) + len(parse_result.mid) + len(parse_result.last)
+
+        score = np.where(all_found_count == all_value_count, 100.0,
+                         np.minimum(self.BASE_SCORE + fir_score + mid_score + last_score, 100.0))
+        score = np.trunc(score) + fir_score_de + mid_score_de + last_score_de
+        if self._multi_region:
+            for field, value, de_score in ((self._region_field, parse_result.region, self.DE_REGION_SCORE),
+                                           (self._street_field, parse_result.street, self.DE_STREET_SCORE)):
+                if field is not None:
+                    idx = fields.index(field)
+                    score += self._de_score(values[:, idx], present[:, idx], value, de_score)
+        return score
+
+    def rerank(self, parse_result: ParseResult, results):
+        """
+        按本地算的分数重新排序, 分数写到每个结果的 score 里。
+        只作为工具类提供, 搜索接口没有调用: 结果里要有 fir_* / mid_* / last_* / building_number 字段,
+        用户接口的 "user" _source 范围会去掉这些字段, 要用 "dev" 范围查询的结果
+        :param results: _get_query_result 返回的结果列表
+        :return: 按分数从高到低排好的结果
+        """
+        scores = self.score(parse_result, results)
+        for result, score in zip(results, scores):
+            result["score"] = float(score)
+        # 稳定排序, 分数相同的保持es的顺序
+        order = np.argsort(-scores, kind="stable")
+        return [results[i] for i in order]
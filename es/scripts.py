@@ -7,6 +7,13 @@
     全部分词都能匹配直接就是100分
     如果超过100分， 100 * (分词匹配到的个数 / 分词总数)
 """
+import functools
+import hashlib
+import re
+
+from addressSearch.es.schemas import es_schema_field_building_number, es_schema_fields_fir, es_schema_fields_mid, \
+    es_schema_fields_last
+
 SEARCH_SCORE_SCRIPT = {
     "script": {
         "lang": "painless",
@@ -184,11 +191,57 @@ SEARCH_SCORE_SCRIPT = {
             }
             //return (int)all_found_count;
             
-            int multi_region = params.multi_region;
-            if (multi_region == 1){
+            if (params.multi_region == 1){
                 return (int)score + de_region_score + de_street_score + fir_score_de + mid_score_de + last_score_de;
             }
             return (int)score + fir_score_de + mid_score_de + last_score_de;
         """
         }
     }
+
+def _to_painless(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def make_score_script_constants(multi_region, region_field, street_field):
+    """
+    评分脚本里不随查询变化的参数
+    :return: 直接写进脚本的常量, 作为参数传入的字段列表
+    """
+    literals = {
+        "multi_region": 1 if multi_region else 0,
+        "region_field": region_field if region_field is not None else "",
+        "street_field": street_field if street_field is not None else "",
+        "query_field_building_number": es_schema_field_building_number
+    }
+    # 列表写成脚本里的变量, 每个文档都要重新创建一次, 所以还是放在 params 里, 一次查询共用
+    lists = {
+        "query_fields_fir": es_schema_fields_fir,
+        "query_fields_mid": es_schema_fields_mid,
+        "query_fields_last": es_schema_fields_last
+    }
+    return literals, lists
+
+
+@functools.lru_cache(maxsize=None)
+def get_baked_score_script(script_id, multi_region, region_field, street_field):
+    """
+    把不变的常量直接替换成脚本里的字面量, 字段列表作为参数传入。
+    脚本id 带上内容的hash, 常量或脚本有变化时id也会变, 不会用到es里旧的脚本
+    :return: 脚本id, 脚本, 查询时要额外传的参数
+    """
+    script = SEARCH_SCORE_SCRIPT["script"]
+    source = script["source"]
+    literals, lists = make_score_script_constants(multi_region, region_field, street_field)
+    for name, value in literals.items():
+        literal = _to_painless(value)
+        source = re.sub(r"params\." + name + r"\b", lambda _: literal, source)
+    params = {name: value for name, value in lists.items() if re.search(r"params\." + name + r"\b", source)}
+
+    schema_hash = hashlib.md5(source.encode("utf-8")).hexdigest()[:10]
+    baked_id = script_id + "_" + schema_hash
+    return baked_id, {"script": {"lang": script["lang"], "source": source}}, params
@@ -20,10 +20,18 @@ class AddressMapping:
     # def get_parsed_data(self, table, page_size, offset):
     #     pass
 
-    @Select("select * from #{table} where op_flag=0 or op_flag=1 or op_flag=2 limit #{limit_size}")
+    # op_flag=3 是上次写入es失败的, 重新写入
+    @Select("select * from #{table} where op_flag=0 or op_flag=1 or op_flag=2 or op_flag=3 limit #{limit_size}")
     def get_parsed_data_limit(self, table, limit_size):
         pass
 
+    # 全量重建es用, 按id顺序分页取所有未删除的数据。
+    # 从es删除成功后解析表中的行也会删掉（PostDataToEsService.set_waiting_completed）, op_flag=2 的是还没删除的
+    # id 是文本主键, order by 和 id>'last_id' 都按文本排序（"10" < "9"）, 两者一致才能不重不漏, 不要改成按数字比较
+    @Select("select * from #{table} where op_flag!=2 and id>'#{last_id}' order by id limit #{limit_size}")
+    def get_parsed_data_after(self, table, last_id, limit_size):
+        pass
+
     # @Select("SELECT * FROM ( SELECT t.*, ROWNUM as rn FROM ( SELECT * FROM #{table} ORDER BY id ) t ) WHERE rn BETWEEN #{start_row} AND #{end_row}")
     # def get_parsed_data_oracle(self, table, start_row, end_row):
     #     pass
@@ -77,3 +85,16 @@ class AddressMapping:
     @Update("delete from #{table} where id='#{table_id}'")
     def delete_row(self, table, table_id):
         pass
+
+    # ============ 批量, table_ids 为 CommonTool.split_sql_in_values 生成的 'a','b','c' ============
+    @Delete("delete from #{table} where id in (#{table_ids})")
+    def delete_data_batch(self, table, table_ids):
+        pass
+
+    @Update("update #{table} set op_flag=9 where id in (#{table_ids})")
+    def set_completed_batch(self, table, table_ids):
+        pass
+
+    @Update("update #{table} set op_flag=3 where id in (#{table_ids})")
+    def set_insert_es_failed_batch(self, table, table_ids):
+        pass
@@ -4,20 +4,36 @@ import threading
 
 import jieba
 from LAC import LAC
+from pySimpleSpringFramework.spring_core.log import log
 from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import Component
-from pySimpleSpringFramework.spring_core.type.annotation.methodAnnotation import Value
+from pySimpleSpringFramework.spring_core.type.annotation.methodAnnotation import Autowired, Value
 
-from addressSearch.es.schemas import es_schema_field_building_number, es_schema_fields_fir, es_schema_fields_main, \
-    es_schema_fields_mid, es_schema_fields_last
+from addressSearch.entity.parseResult import ParseResult
+from addressSearch.service.parseMetricsService import ParseMetricsService
 from addressSearch.utils.commonTool import CommonTool
+from addressSearch.utils.dictSnapshot import DictSnapshot
+from addressSearch.utils.lruCache import LruCache
+from addressSearch.utils.segmentCache import SegmentCache, SegmentMemo
+from addressSearch.utils.wordTrie import WordTrie
 
 
 @Component
 class AddressParseService:
     __local_obj = threading.local()
 
+    # 中文数字（楼栋的允许带"零"）
+    __COURTYARD_NUMBER_CHARS = "一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北"
+    __BUILDING_NUMBER_CHARS = "零" + __COURTYARD_NUMBER_CHARS
+
+    # 没有配置 project.parse_cache.* 时的默认值
+    __PARSE_CACHE_SIZE = 10000
+    __PARSE_CACHE_TTL = 3600
+
     @Value({
         "project.print_debug": "_print_debug",
+        "project.lac.segment_cache_size": "_segment_cache_size",
+        "project.parse_cache.max_size": "_parse_cache_size",
+        "project.parse_cache.ttl": "_parse_cache_ttl",
         "project.big_region.province": "_provinces",
         "project.big_region.city": "_cities",
         "project.big_region.region": "_regions",
@@ -61,98 +77,422 @@ class AddressParseService:
         self._conjunction_re_patterns_get_behind = None
         self._extra_symbols = None
 
+        # 预编译的正则: { 名称: (合并后的正则, [(中文标识符, [正则1, 正则2, 正则3, 正则4]), ...]) }
+        self._patterns = {}
+
+        # 省、市、区、街道的前缀树
+        self._province_trie = None
+        self._city_trie = None
+        self._region_trie = None
+        self._street_trie = None
+        self._big_region_trie = None
+        self._big_region_words = frozenset()
+
+        # 进程内共享的分词缓存大小, 0 为不使用（只在一次解析内缓存）
+        self._segment_cache_size = 0
+        self._segment_cache = None
+
+        # 解析结果缓存, key 是 prepareAddress 之后的地址。 ttl 单位秒, 配置成 0 不使用缓存
+        self._parse_cache_size = self.__PARSE_CACHE_SIZE
+        self._parse_cache_ttl = self.__PARSE_CACHE_TTL
+        self._parse_cache = None
+        self._parse_cache_version = None
+        self._big_region_version = None
+
+        self._parseMetricsService = None
+
+        # LAC字典快照, 所有线程共用
+        self._dict_snapshot = DictSnapshot()
+        self._dict_snapshot_lock = threading.Lock()
+
+    @Autowired
+    def set_params(self, parseMetricsService: ParseMetricsService):
+        self._parseMetricsService = parseMetricsService
+
     def _after_init(self):
         # 按字符串长度排序（从长到短）， 不然替换移除的时候可能出问题，比如： 鸿山、鸿山街道， 移除后会留下街道
         self._streets = sorted(self._streets, key=lambda i: len(i), reverse=True)
         self._cities = sorted(self._cities, key=lambda i: len(i), reverse=True)
         self._regions = sorted(self._regions, key=lambda i: len(i), reverse=True)
 
+        self._patterns = {
+            "building": self.__compile_patterns(self._building_chinese_words, self.__BUILDING_NUMBER_CHARS),
+            "courtyard": self.__compile_patterns(self._courtyard_chinese_words, self.__COURTYARD_NUMBER_CHARS),
+            "extract_again": self.__compile_patterns(self._extract_again_chinese_words,
+                                                     self.__COURTYARD_NUMBER_CHARS),
+        }
+
+        # 前缀树总是最长匹配，和上面从长到短排序的效果一样
+        self._province_trie = WordTrie(self._provinces)
+        self._city_trie = WordTrie(self._cities)
+        self._region_trie = WordTrie(self._regions)
+        self._street_trie = WordTrie(self._streets)
+        big_region_words = list(self._provinces) + self._cities + self._regions + self._streets
+        self._big_region_trie = WordTrie(big_region_words)
+        self._big_region_words = frozenset(big_region_words)
+
+        self._segment_cache = SegmentCache(int(self._segment_cache_size or 0))
+        self._parse_cache = self.__create_parse_cache()
+        self._big_region_version = hash(tuple(big_region_words))
+
+    def __create_parse_cache(self):
+        size = self.__PARSE_CACHE_SIZE if self._parse_cache_size is None else int(self._parse_cache_size)
+        ttl = self.__PARSE_CACHE_TTL if self._parse_cache_ttl is None else int(self._parse_cache_ttl)
+        if size <= 0:
+            log.info("解析结果缓存未启用, project.parse_cache.max_size = " + str(size))
+        return LruCache(size, ttl)
+
+    @staticmethod
+    def __compile_patterns(symbols, number_chars):
+        """
+        预编译中文标识符相关的正则，只在初始化时做一次
+        :param symbols: 中文标识符，比如：栋、幢、区
+        :param number_chars: 允许的中文数字
+        :return: (合并后的正则, [(中文标识符, [正则, ...]), ...])
+        """
+        symbol_patterns = []
+        for symbol in symbols:
+            re_strs = [
+                r'第+\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
+                r'\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
+                r'(第+[' + number_chars + ']+' + symbol + ')',  # 中文数字
+                r'([' + number_chars + ']+' + symbol + ')'  # 中文数字
+            ]
+            symbol_patterns.append((symbol, [re.compile(re_str) for re_str in re_strs]))
+
+        if len(symbol_patterns) == 0:
+            return None, symbol_patterns
+
+        # 所有标识符合并成一个正则, 只用来预先过滤: 能匹配任意一个单独的正则就一定能匹配它。
+        # 匹配到以后还是按原来的顺序逐个正则匹配, 取最后一个不在字典里的结果
+        family_re_str = (r'(?:第+\d+[A-Za-z]+|\d+[A-Za-z]+|\d+|[A-Za-z]+\d+|[A-Za-z]+'
+                         r'|第+[' + number_chars + ']+|[' + number_chars + ']+)'
+                         r'(?:' + "|".join(symbols) + ')')
+        return re.compile(family_re_str), symbol_patterns
+
+    def __candidate_patterns(self, name, addr_string, only_start=False):
+        """
+        预先过滤: 先用合并后的正则扫描一次，匹配不到就不用再逐个标识符去匹配了
+        :param name: building / courtyard / extract_again
+        :param addr_string:
+        :param only_start: 是否必须从开头匹配
+        :return: [(中文标识符, [正则, ...]), ...]
+        """
+        family_pattern, symbol_patterns = self._patterns[name]
+        if family_pattern is None:
+            return []
+
+        match = family_pattern.match(addr_string) if only_start else family_pattern.search(addr_string)
+        if not match:
+            return []
+        return [(symbol, patterns) for symbol, patterns in symbol_patterns if symbol in addr_string]
+
     def __print(self, msg):
         if self._print_debug:
             print(msg)
 
     @staticmethod
     def __fail_ret():
-        return False, None, None, None, None, None, None, None
+        return ParseResult.fail()
+
+    def __begin_segment(self, model: LAC):
+        """
+        一次解析内同样的字符串只分词一次
+        """
+        return SegmentMemo(model, self._segment_cache)
+
+    def __end_segment(self, memo: SegmentMemo, parse_count=0):
+        self.__local_obj.segment_stats = memo.stats
+        self.__print("分词缓存: " + str(memo.stats))
+
+        if parse_count > 0:
+            self._parseMetricsService.observe("lac_calls", memo.lac_calls / parse_count, parse_count)
+            self._parseMetricsService.incr("parses", parse_count)
+            self._parseMetricsService.incr("lac_calls", memo.lac_calls)
+            self._parseMetricsService.incr("segment_hits", memo.hits)
+            self._parseMetricsService.incr("segment_misses", memo.misses)
+
+    def get_segment_stats(self):
+        """
+        当前线程最近一次解析的分词缓存命中情况
+        :return: {"hits": n, "misses": n}
+        """
+        return getattr(self.__local_obj, "segment_stats", {"hits": 0, "misses": 0})
+
+    def clear_segment_cache(self):
+        """
+        LAC字典变化后需要清掉进程内的分词缓存
+        """
+        if self._segment_cache is not None:
+            self._segment_cache.clear()
+
+    def clear_cache(self):
+        """
+        清掉分词缓存和解析结果缓存
+        """
+        self.clear_segment_cache()
+        if self._parse_cache is not None:
+            self._parse_cache.clear()
+
+    def get_cache_stats(self):
+        return self._parse_cache.stats() if self._parse_cache is not None else {}
+
+    def __check_cache_version(self):
+        """
+        LAC字典或者省市区街道配置变了, 缓存的结果就不能用了
+        """
+        version = (self._dict_snapshot.version, self._big_region_version)
+        if version != self._parse_cache_version:
+            self.clear_cache()
+            self._parse_cache_version = version
+
+    def __refresh_dict_snapshot(self, model: LAC):
+        """
+        字典重新加载后生成新的快照，整体替换
+        """
+        dictitem = model.__getattribute__("model").custom.dictitem
+        if not self._dict_snapshot.is_stale(dictitem):
+            return
+        with self._dict_snapshot_lock:
+            if self._dict_snapshot.is_stale(dictitem):
+                self._dict_snapshot = DictSnapshot(dictitem)
+
+    @staticmethod
+    def __prefetch_segment(model: SegmentMemo, addr_strings):
+        """
+        整批交给LAC分词，后面每个地址再分词时直接命中缓存
+        """
+        addr_strings = [s for s in addr_strings if s is not None and s != ""]
+        if len(addr_strings) > 0:
+            model.run(addr_strings)
+
+    def __pop_region_street(self):
+        region = self.__local_obj.region if hasattr(self.__local_obj, "region") else None
+        street = self.__local_obj.street if hasattr(self.__local_obj, "street") else None
+        self.__local_obj.region = None
+        self.__local_obj.street = None
+        return region, street
+
+    def __run_stage(self, name, items: dict, stage):
+        """
+        对每个地址执行一步，出错或返回False的地址不再往下处理
+        """
+        with self._parseMetricsService.timer(name, len(items)):
+            self.__run_items(items, stage)
+
+    def __run_items(self, items: dict, stage):
+        for i, item in list(items.items()):
+            try:
+                if not stage(item):
+                    del items[i]
+            except Exception as e:
+                self.__print(str(e))
+                del items[i]
 
     def cutOnly(self, model: LAC, addr_string: str):
         """
         仅产生分词结果
         """
-        if not hasattr(self.__local_obj, "model_dict"):
-            self.__local_obj.model_dict = model.__getattribute__("model").custom.dictitem
+        return self.cut_batch(model, [addr_string])[0]
 
-        addr_string = self.prepareAddress(addr_string)
-        addr_string, ret_remove_words = self.removeStartWordsIfNecessary(model, addr_string)
-        addr_string = self.removeExtra(addr_string)
-        cut_list = model.run(addr_string)
-        return ret_remove_words + cut_list[0]
+    def cut_batch(self, model: LAC, addr_strings: list):
+        """
+        批量仅产生分词结果
+        """
+        self.__refresh_dict_snapshot(model)
+
+        self.__check_cache_version()
+
+        # 每个地址单独处理, 一个出错只返回它自己的空结果
+        rets = [[] for _ in addr_strings]
+        keys = {}
+        with self._parseMetricsService.timer("prepareAddress", len(addr_strings)):
+            for i, addr_string in enumerate(addr_strings):
+                try:
+                    key = ("cut", self.prepareAddress(addr_string))
+                except Exception as e:
+                    self.__print(str(e))
+                    continue
+                if key[1] == "":
+                    continue
+                cached = self._parse_cache.get(key)
+                if cached is not None:
+                    rets[i] = list(cached)
+                else:
+                    keys[i] = key
+        if len(keys) == 0:
+            return rets
+
+        model = self.__begin_segment(model)
+        try:
+            prepared = {}
+            succeeded = []
+            with self._parseMetricsService.timer("removeStartWords", len(keys)):
+                self.__prefetch_segment(model, [key[1] for key in keys.values()])
+                for i, key in keys.items():
+                    try:
+                        addr_string, ret_remove_words = self.removeStartWordsIfNecessary(model, key[1])
+                        addr_string = self.removeExtra(addr_string)
+                    except Exception as e:
+                        self.__print(str(e))
+                        continue
+                    finally:
+                        self.__pop_region_street()
+                    # 去掉开头的词后可能什么都不剩, 空字符串不用交给LAC
+                    if addr_string == "":
+                        rets[i] = ret_remove_words
+                        succeeded.append(i)
+                        continue
+                    prepared[i] = (addr_string, ret_remove_words)
+
+            if len(prepared) > 0:
+                idx_list = list(prepared.keys())
+                with self._parseMetricsService.timer("participle", len(idx_list)):
+                    cut_lists = model.run([prepared[i][0] for i in idx_list])
+                for i, cut_list in zip(idx_list, cut_lists):
+                    rets[i] = prepared[i][1] + cut_list[0]
+                    succeeded.append(i)
+
+            # 出错的不缓存
+            for i in succeeded:
+                self._parse_cache.put(keys[i], tuple(rets[i]))
+            return rets
+        finally:
+            self.__end_segment(model, len(keys))
 
     def run(self, model: LAC, addr_string: str, is_participle_continue=False):
         """
         :param model:
         :param addr_string:
         :param is_participle_continue:
-        :return:
+        :return: ParseResult, 也可以按原来的 8 个值解包
         """
-        if not hasattr(self.__local_obj, "model_dict"):
-            self.__local_obj.model_dict = model.__getattribute__("model").custom.dictitem
-
-        try:
-            addr_string = self.prepareAddress(addr_string)
+        return self.run_batch(model, [addr_string], is_participle_continue)[0]
 
-            if not self.acceptAddress(addr_string):
-                return self.__fail_ret()
+    def run_batch(self, model: LAC, addr_strings: list, is_participle_continue=False):
+        """
+        批量解析。每一步整批地址一起处理, 需要分词的时候整批交给LAC
+        :param model:
+        :param addr_strings:
+        :param is_participle_continue:
+        :return: 每个地址对应一个 ParseResult
+        """
+        self.__refresh_dict_snapshot(model)
+
+        rets = [self.__fail_ret() for _ in addr_strings]
+        items = {}
+        for i, addr_string in enumerate(addr_strings):
+            items[i] = {"addr_string": addr_string}
+
+        # 预处理
+        self.__run_stage("prepareAddress", items, self.__stage_prepare)
+
+        # 解析结果缓存
+        self.__check_cache_version()
+        keys = {}
+        for i, item in list(items.items()):
+            key = ("parse", is_participle_continue, item["addr_string"])
+            cached = self._parse_cache.get(key)
+            if cached is not None:
+                rets[i] = cached.copy()
+                del items[i]
+            else:
+                keys[i] = key
+        if len(items) == 0:
+            return rets
 
-            addr_string, _ = self.removeStartWordsIfNecessary(model, addr_string)
-            addr_string = self.removeExtra(addr_string)
-            self.__print("移除无用信息: " + str(addr_string))
+        model = self.__begin_segment(model)
+        try:
 
-            _, addr_string, last_string = self.cutAddress(model, addr_string)
+            # 移除 省、市、区、街道
+            with self._parseMetricsService.timer("removeStartWords", len(items)):
+                self.__prefetch_segment(model, [item["addr_string"] for item in items.values()])
+                self.__run_items(items, lambda item: self.__stage_remove_start_words(model, item))
 
-            if addr_string is None or addr_string == "":
-                return self.__fail_ret()
+            # 截取到楼栋
+            self.__run_stage("cutAddress", items, lambda item: self.__stage_cut_address(model, item))
 
             # 分詞並處理
-            cut_list = self.participleAndProcess(model, addr_string)
-            # 每个分词再次判断处理
-            if is_participle_continue:
-                cut_list = self.participleContinue(model, cut_list)
-                self.__print("二次分词结果: " + str(cut_list))
+            with self._parseMetricsService.timer("participleAndProcess", len(items)):
+                self.__prefetch_segment(model, [item["addr_string"] for item in items.values()])
+                self.__run_items(items, lambda item: self.__stage_participle(model, item, is_participle_continue))
+
+            # 找主体, 并生成 sections
+            self.__prefetch_segment(model, [item["last_string"] for item in items.values()])
+            self.__run_items(items, lambda item: self.__stage_create_sections(model, item))
+
+            for i, item in items.items():
+                rets[i] = item["ret"]
+            # 只缓存解析成功的, 出错或者没解析出来的下次重新解析
+            for i, key in keys.items():
+                if rets[i].succeed:
+                    self._parse_cache.put(key, rets[i].copy())
+        finally:
+            self.__local_obj.region = None
+            self.__local_obj.street = None
+            self.__end_segment(model, len(keys))
+        return rets
 
-            if cut_list is None:
-                return self.__fail_ret()
+    def __stage_prepare(self, item):
+        item["addr_string"] = self.prepareAddress(item["addr_string"])
+        return self.acceptAddress(item["addr_string"])
 
-            # 找主体
+    def __stage_remove_start_words(self, model: LAC, item):
+        try:
+            addr_string, _ = self.removeStartWordsIfNecessary(model, item["addr_string"])
+        finally:
+            item["region"], item["street"] = self.__pop_region_street()
+        item["addr_string"] = self.removeExtra(addr_string)
+        self.__print("移除无用信息: " + str(item["addr_string"]))
+        return True
+
+    def __stage_cut_address(self, model: LAC, item):
+        _, addr_string, last_string = self.cutAddress(model, item["addr_string"])
+        item["addr_string"] = addr_string
+        item["last_string"] = last_string
+        return addr_string is not None and addr_string != ""
+
+    def __stage_participle(self, model: LAC, item, is_participle_continue):
+        cut_list = self.participleAndProcess(model, item["addr_string"])
+        # 每个分词再次判断处理
+        if is_participle_continue:
+            cut_list = self.participleContinue(model, cut_list)
+            self.__print("二次分词结果: " + str(cut_list))
+        item["cut_list"] = cut_list
+        return cut_list is not None
+
+    def __stage_create_sections(self, model: LAC, item):
+        addr_string = item["addr_string"]
+        cut_list = item["cut_list"]
+        last_string = item["last_string"]
+
+        # 找主体
+        with self._parseMetricsService.timer("findMainBody"):
             body_idx = self.findMainBodyIndex(model, addr_string, cut_list)
+        if body_idx == -1:
+            return False
+        # 处理并生成 sections
+        with self._parseMetricsService.timer("create_sections"):
+            succeed, parse_result = self.create_sections(cut_list, body_idx, model, last_string)
+
+        #  -------------
+        if not succeed:
+            self._parseMetricsService.incr("findMainBodyIndexReverse")
+            # 找主体
+            with self._parseMetricsService.timer("findMainBody"):
+                body_idx = self.findMainBodyIndexReverse(model, addr_string, cut_list)
             if body_idx == -1:
-                return self.__fail_ret()
+                return False
             # 处理并生成 sections
-            succeed, [address_section_first, address_section_main, address_section_mid, address_section_last,
-                      address_section_build_number] = self.create_sections(
-                cut_list, body_idx, model, last_string)
-
-            #  -------------
-            if not succeed:
-                # 找主体
-                body_idx = self.findMainBodyIndexReverse(model, addr_string, cut_list)
-                if body_idx == -1:
-                    return self.__fail_ret()
-                # 处理并生成 sections
-                succeed, [address_section_first, address_section_main, address_section_mid, address_section_last,
-                          address_section_build_number] = self.create_sections(
-                    cut_list, body_idx, model, last_string)
-
-            region = self.__local_obj.region if hasattr(self.__local_obj, "region") else None
-            street = self.__local_obj.street if hasattr(self.__local_obj, "street") else None
-
-            return succeed, region, street, address_section_first, address_section_main, address_section_mid, address_section_last, address_section_build_number
-        except Exception as e:
-            self.__print(str(e))
-        finally:
-            self.__local_obj.region = None
-            self.__local_obj.street = None
-        return self.__fail_ret()
+            with self._parseMetricsService.timer("create_sections"):
+                succeed, parse_result = self.create_sections(cut_list, body_idx, model, last_string)
+
+        if parse_result is None:
+            parse_result = ParseResult(False)
+        parse_result.region = item["region"]
+        parse_result.street = item["street"]
+        item["ret"] = parse_result
+        return True
 
     def participleContinue(self, model: LAC, cut_list):
         word_list = cut_list[0]
@@ -160,7 +500,7 @@ class AddressParseService:
         word_list_ret = copy.deepcopy(word_list)
 
         # 獲取加載的字典表
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
         for i in range(len(word_list) - 1, -1, -1):
             word = word_list[i]
             if word in model_dict:
@@ -222,32 +562,25 @@ class AddressParseService:
         ret_remove_words = []
 
         # 如果第1个分词就在字典表里，说明不需要处理这一步了。 因为 省、市、区、街道 不放在字典中
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
         cut_list = model.run(addr_string)[0]
         first_word = cut_list[0]
-        if first_word in model_dict.keys():
+        if first_word in model_dict:
             return addr_string, ret_remove_words
 
-        remove_list = [self._provinces, self._cities]
-        for remove_words in remove_list:
-            for remove_word in remove_words:
-                if addr_string.startswith(remove_word):
-                    addr_string = addr_string.replace(remove_word, "", 1)
-                    ret_remove_words.append(remove_word)
-
-        for remove_word in self._regions:
-            if addr_string.startswith(remove_word):
-                self.__local_obj.region = remove_word
-                addr_string = addr_string.replace(remove_word, "", 1)
-                ret_remove_words.append(remove_word)
-                break
+        for trie in [self._province_trie, self._city_trie]:
+            addr_string, remove_words = trie.strip_prefix(addr_string, repeat=True)
+            ret_remove_words.extend(remove_words)
 
-        for remove_word in self._streets:
-            if addr_string.startswith(remove_word):
-                self.__local_obj.street = remove_word
-                addr_string = addr_string.replace(remove_word, "", 1)
-                ret_remove_words.append(remove_word)
-                break
+        addr_string, remove_words = self._region_trie.strip_prefix(addr_string)
+        if len(remove_words) > 0:
+            self.__local_obj.region = remove_words[0]
+            ret_remove_words.extend(remove_words)
+
+        addr_string, remove_words = self._street_trie.strip_prefix(addr_string)
+        if len(remove_words) > 0:
+            self.__local_obj.street = remove_words[0]
+            ret_remove_words.extend(remove_words)
 
         return addr_string, ret_remove_words
 
@@ -332,27 +665,21 @@ class AddressParseService:
         :return:
         """
         number = -1
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
         # 在字典中则不处理
-        if addr_string in model_dict.keys():
+        if addr_string in model_dict:
             return -1
 
         # 1. 根据中文标识符判断
-        for symbol in self._courtyard_chinese_words:
-            re_strs = [
-                r'第+\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'(第+[一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')',  # 中文数字
-                r'([一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')'  # 中文数字
-            ]
-            for re_str in re_strs:
-                match = re.search(re_str, addr_string)
+        for symbol, patterns in self.__candidate_patterns("courtyard", addr_string, only_start=True):
+            for pattern in patterns:
+                match = pattern.search(addr_string)
                 if match:
                     result = match.group(0)
 
                     # 在字典中则不处理
-                    if result in model_dict.keys():
+                    if result in model_dict:
                         continue
 
                     # 必须开头才行
@@ -376,25 +703,19 @@ class AddressParseService:
         cut_list = []
         last_string = None
 
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
-        chinese_words = self._extract_again_chinese_words if not judge_in_before_building_words else self._courtyard_chinese_words
+        patterns_name = "extract_again" if not judge_in_before_building_words else "courtyard"
 
         # 1. 根据中文标识符判断
-        for symbol in chinese_words:
-            re_strs = [
-                r'第+\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'(第+[一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')',  # 中文数字
-                r'([一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')'  # 中文数字
-            ]
-            for re_str in re_strs:
-                match = re.search(re_str, addr_string)
+        for symbol, patterns in self.__candidate_patterns(patterns_name, addr_string):
+            for pattern in patterns:
+                match = pattern.search(addr_string)
                 if match:
                     result = match.group(0)
 
                     # 在字典中则不处理
-                    if result in model_dict.keys():
+                    if result in model_dict:
                         continue
 
                     # print(result)
@@ -435,7 +756,7 @@ class AddressParseService:
         cut_succeed = False
         find_result = None
 
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
         # 1. 根据中文标识符判断 (特殊标识)
         for symbol in self._special_building_chinese_words:
@@ -445,7 +766,7 @@ class AddressParseService:
                 return True, addr_string[:find_idx], addr_string[find_idx:]
 
         # 2. 根据中文标识符判断 (通用标识)
-        for symbol in self._building_chinese_words:
+        for symbol, patterns in self.__candidate_patterns("building", addr_string):
             # if cut_succeed:
             #     break
 
@@ -457,19 +778,13 @@ class AddressParseService:
             if is_go:
                 continue
 
-            re_strs = [
-                r'第+\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'\d+[A-Za-z]+区|\d+区|[A-Za-z]+区|[A-Za-z]+\d+区'.replace("区", symbol),  # 阿拉伯数字和字母的组合
-                r'(第+[零一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')',  # 中文数字
-                r'([零一二三四五六七八九十〇壹贰叁肆伍陆柒捌玖拾百佰千仟万亿东南西北]+' + symbol + ')'  # 中文数字
-            ]
-            for re_str in re_strs:
-                match = re.search(re_str, addr_string)
+            for pattern in patterns:
+                match = pattern.search(addr_string)
                 if match:
                     result = match.group(0)
 
                     # 在字典中则不处理
-                    if result in model_dict.keys():
+                    if result in model_dict:
                         continue
 
                     find_result = result
@@ -526,8 +841,8 @@ class AddressParseService:
                     last_string = self._CONJUNCTION.join(cut_words[idx_s + 1:])
 
                 # 獲取加載的字典表
-                model_dict = self.__local_obj.model_dict
-                if word in model_dict.keys():
+                model_dict = self._dict_snapshot.words
+                if word in model_dict:
                     join_symbol = "号" if CommonTool.is_last_char_number(word) else ""
                     cut_addr_string = cut_addr_string + join_symbol + CommonTool.remove_chinese_chars(word_d)
 
@@ -547,7 +862,7 @@ class AddressParseService:
         :return:
         """
         # 獲取加載的字典表
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
         # # 帶方向的名稱判斷。  无锡市江阴市周庄镇长南村培元路107号北3米平房 ， 這裡有個“长南村”，有個“南”字， 就把它分成： 无锡市江阴市周庄镇 和 培元路107号北3米平房，再分別判斷
         # for name in self._dir_rel_names:
@@ -588,13 +903,13 @@ class AddressParseService:
                 # 分词后看第1个词, 第1个词是涉及方向的，但是可能在字典中
                 cut_words = model.run(result)[0]
                 cut_first_word = cut_words[0]
-                if cut_first_word not in model_dict.keys():
+                if cut_first_word not in model_dict:
                     # 可能中间被截断，要获取整个词，判断是否在字典中。如果在就不要操作了。
                     # 比如: 东贤中路67号丁蜀中心幼儿园东行50米 , 会把整个都找到，但是"东贤中路"是字典
                     # 比如: 阳泉西路188号红星美凯龙3层西北方向70米， 会找到:西路188号红星美凯龙3层西北方向70米，但是"阳泉西路"是字典
                     for word in cut_words_origin:
                         # 找到截取对应的分词的那个词，并判断是否在字典中
-                        if word.endswith(cut_first_word) and word not in model_dict.keys():
+                        if word.endswith(cut_first_word) and word not in model_dict:
                             break
 
                 s = "".join(cut_words[1:])
@@ -604,7 +919,7 @@ class AddressParseService:
                 result = match.group(0)
 
             # 不在字典内就分割出去
-            if result not in model_dict.keys():
+            if result not in model_dict:
                 cut_succeed = True
                 addr_string = addr_string.split(result)[0] if get_front else addr_string.split(result)[1]
             self.__print("截取到楼栋: " + addr_string)
@@ -646,19 +961,13 @@ class AddressParseService:
         lac_words = cut_list[1]
 
         # 獲取加載的字典表
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
         # 去掉分词是省、市、区、街道的
         remove_idx_ls = []
         for i in range(len(cut_words)):
             j_word = cut_words[i]
-            if j_word in self._provinces and j_word not in model_dict.keys():
-                remove_idx_ls.insert(0, i)
-            elif j_word in self._cities and j_word not in model_dict.keys():
-                remove_idx_ls.insert(0, i)
-            elif j_word in self._regions and j_word not in model_dict.keys():
-                remove_idx_ls.insert(0, i)
-            elif j_word in self._streets and j_word not in model_dict.keys():
+            if j_word in self._big_region_words and j_word not in model_dict:
                 remove_idx_ls.insert(0, i)
         for idx in remove_idx_ls:
             cut_words.pop(idx)
@@ -667,17 +976,9 @@ class AddressParseService:
         # 去掉词中的省、市、区、街道
         for i in range(len(cut_words)):
             j_word = cut_words[i]
-            if j_word in model_dict.keys():
+            if j_word in model_dict:
                 continue
-            for w in self._provinces:
-                j_word = j_word.replace(w, "")
-            for w in self._cities:
-                j_word = j_word.replace(w, "")
-            for w in self._regions:
-                j_word = j_word.replace(w, "")
-            for w in self._streets:
-                j_word = j_word.replace(w, "")
-            cut_words[i] = j_word
+            cut_words[i] = self._big_region_trie.remove_all(j_word)
 
     @staticmethod
     def removeSingleChinese(cut_list):
@@ -709,7 +1010,7 @@ class AddressParseService:
         :return:
         """
         # 獲取加載的字典表
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
 
         cut_words = cut_list[0]
         lac_words = cut_list[1]
@@ -723,7 +1024,7 @@ class AddressParseService:
             for useless_lac in useless_lac_list:
                 word = cut_words[i]
                 # 詞性吻合並不在字典中
-                if lac_words[i] == useless_lac and word not in model_dict.keys():
+                if lac_words[i] == useless_lac and word not in model_dict:
                     remove_idx_ls.insert(0, i)
 
         for idx in remove_idx_ls:
@@ -765,20 +1066,18 @@ class AddressParseService:
             if number > 0:
                 cut_words[i] = str(number)
 
-    def __last_process(self, section_first, section_main):
-        ls = [section_first, section_main]
-        for sect in ls:
-            for k, v in sect.items():
-                for word in self._remove_last_words:
-                    v = str(v)
-                    if v.endswith(word):
-                        sect[k] = v[:len(v) - 1]
+    def __last_process(self, value):
+        ret = value = str(value)
+        for word in self._remove_last_words:
+            if value.endswith(word):
+                ret = value[:len(value) - 1]
+        return ret
 
     def findMainBodyIndexByDict(self, model: LAC, cut_words, only_in_dict_return=False):
         """
         根据字典表，截取到楼栋的位置。（分词在字典中，且该词的后一个词是数字。 only_in_dict_return=True则，分词在字典中就返回）
         """
-        model_dict = self.__local_obj.model_dict
+        model_dict = self._dict_snapshot.words
         find_idx = -1
 
         for i in range(len(cut_words) - 1, -1, -1):
@@ -881,7 +1180,7 @@ class AddressParseService:
 
         return idx
 
-    def __process_last_string(self, model: LAC, address_section_last, last_string):
+    def __process_last_string(self, model: LAC, address_section_last: list, last_string):
         last_string_copy = copy.deepcopy(last_string)
         if last_string is not None and last_string != "":
             for num_symbol in self._conjunction_symbols:
@@ -892,78 +1191,50 @@ class AddressParseService:
                 last_cut_list.remove("")
             if len(last_cut_list) > self._LAST_MAX_LEN:
                 last_cut_list = last_cut_list[:self._LAST_MAX_LEN]
-            for i in range(len(last_cut_list)):
-                field_name = "last_" + str(i + 1)
-                address_section_last[field_name] = last_cut_list[i]
+            address_section_last.extend(last_cut_list)
 
             # 后面部分可能有中文， 这个中文如果在字典表中，且还有位置放，则保留下来
             if self._LAST_MAX_LEN > len(last_cut_list):
                 # 獲取加載的字典表
-                model_dict = self.__local_obj.model_dict
+                model_dict = self._dict_snapshot.words
 
-                idx = len(last_cut_list)
                 cut_list = model.run(last_string_copy)[0]
                 for word in cut_list:
                     if word in model_dict:
-                        field_name = "last_" + str(idx + 1)
-                        address_section_last[field_name] = word
-                        idx += 1
-                    if idx >= self._LAST_MAX_LEN:
+                        address_section_last.append(word)
+                    if len(address_section_last) >= self._LAST_MAX_LEN:
                         break
 
     def create_sections(self, cut_list, body_idx, model: LAC, last_string):
+        """
+        生成 sections
+        :return: succeed, ParseResult
+        """
         cut_words = cut_list[0]
 
-        # 主体前的部分
-        address_section_first = {}
-        # 主体
-        address_section_main = {}
-        # 主体后 到 楼栋之间的部分
-        address_section_mid = {}
-        # last部分
-        address_section_last = {}
-
-        # 赋值
-        idx = 1
-        for i in range(body_idx):
-            field_name = "fir_" + str(idx)
-            address_section_first[field_name] = cut_words[i]
-            idx += 1
-
-        address_section_main["f_main"] = cut_words[body_idx]
-
-        idx = 1
-        for i in range(body_idx + 1, len(cut_words)):
-            field_name = "mid_" + str(idx)
-            address_section_mid[field_name] = cut_words[i]
-            idx += 1
-
-        address_section_build_number = {es_schema_field_building_number: 0}
-        if len(address_section_mid) > 0:
+        parse_result = ParseResult(True,
+                                   fir=cut_words[:body_idx],
+                                   main=cut_words[body_idx],
+                                   mid=cut_words[body_idx + 1:])
+
+        if len(parse_result.mid) > 0:
             try:
-                # 如果只有1个值，就是 mid_1 ,  如果有2个值，就是 mid_2
-                key_name = "mid_" + str(len(address_section_mid))
-                building_num = address_section_mid[key_name]
-                building_num = CommonTool.convert_building_num(building_num)
-                address_section_build_number[es_schema_field_building_number] = building_num
+                # 最后1个值是楼栋号
+                parse_result.building_number = CommonTool.convert_building_num(parse_result.mid[-1])
             except:
                 pass
 
         # last_string 部分分词
-        self.__process_last_string(model, address_section_last, last_string)
+        self.__process_last_string(model, parse_result.last, last_string)
 
-        if (len(address_section_first) > len(es_schema_fields_fir)
-                or len(address_section_main) > len(es_schema_fields_main)
-                or len(address_section_mid) > len(es_schema_fields_mid)
-                or len(address_section_last) > len(es_schema_fields_last)):
+        if parse_result.is_overflow():
             self.__print(f"解析出的长度超限制, cut_list = {cut_list}")
-            return False, [None, None, None, None, None]
+            return False, None
 
         # 最后的处理
-        self.__last_process(address_section_first, address_section_main)
+        parse_result.fir = [self.__last_process(v) for v in parse_result.fir]
+        parse_result.main = self.__last_process(parse_result.main)
 
         self.__print("=== sections ===")
-        self.__print(str(address_section_first) + str(address_section_main) + str(address_section_mid) +
-                     str(address_section_last) + str(address_section_build_number))
-        return True, [address_section_first, address_section_main, address_section_mid, address_section_last,
-                      address_section_build_number]
+        self.__print(str(parse_result.to_row()))
+        return True, parse_result
@@ -1,3 +1,4 @@
+import asyncio
 import threading
 
 import requests
@@ -19,13 +20,16 @@ class AiModelService:
         """
         self._ai_rest_url = None
         self.__local_obj.s = None
+        # 异步请求用的session, 每个事件循环一个
+        self._async_sessions = {}
 
     def run(self, address):
         r = requests.post(self._ai_rest_url, data={"1": address})
         return self._get_result(r)
 
     def run_by_session(self, address):
-        if self.__local_obj.s is None:
+        # 每个线程各自的session
+        if getattr(self.__local_obj, "s", None) is None:
             self.__local_obj.s = requests.Session()
 
         r = self.__local_obj.s.post(self._ai_rest_url, data={"1": address})
@@ -35,6 +39,37 @@ class AiModelService:
 
         return self._get_result(r)
 
+    def __get_async_session(self):
+        # 需要安装 aiohttp
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(id(loop))
+        if session is None or session.closed:
+            session = aiohttp.ClientSession()
+            self._async_sessions[id(loop)] = session
+        return session
+
+    async def close_async(self):
+        """
+        关闭当前事件循环的session, 服务停止时调用
+        """
+        session = self._async_sessions.pop(id(asyncio.get_running_loop()), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def run_async(self, address):
+        """
+        异步调用，不阻塞事件循环
+        """
+        session = self.__get_async_session()
+        try:
+            async with session.post(self._ai_rest_url, data={"1": address}) as r:
+                return await r.json(content_type=None)
+        except Exception as e:
+            log.error(str(e))
+        return None
+
     def close(self):
         try:
             self.__local_obj.s.close()
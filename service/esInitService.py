@@ -1,36 +1,107 @@
+from datetime import datetime
+
+from pySimpleSpringFramework.spring_core.log import log
 from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import Component
 from pySimpleSpringFramework.spring_core.type.annotation.methodAnnotation import Autowired, Value
 
 from addressSearch.es.elasticsearchManger import ElasticsearchManger
 from addressSearch.es.schemas import schemaMain
-from addressSearch.es.scripts import SEARCH_SCORE_SCRIPT
+from addressSearch.es.scripts import get_baked_score_script
 from addressSearch.service.configService import ConfigService
 
 
 @Component
 class EsInitService:
     @Value({
-        "project.score_script_id": "_score_script_id"
+        "project.score_script_id": "_score_script_id",
+        "project.big_region.region_field": "_region_field",
+        "project.big_region.street_field": "_street_field",
+        "project.big_region.multi_region": "_multi_region",
     })
     def __init__(self):
         self._configService = None
         self._score_script_id = None
+        self._region_field = None
+        self._street_field = None
+        self._multi_region = False
+        self._rebuild_replicas = 1
 
     @Autowired
     def set_params(self, configService: ConfigService):
         self._configService = configService
 
-    def create_scripts(self):
+    def __create_es_cli(self):
         ip = self._configService.get_es_cnf("ip")
         port = int(self._configService.get_es_cnf("port"))
         username = self._configService.get_es_cnf("username")
         password = self._configService.get_es_cnf("password")
         db_name_address = self._configService.get_es_cnf("db_name_address")
+        return ElasticsearchManger(db_name_address, schemaMain, ip, port, username, password)
+
+    def begin_rebuild(self):
+        """
+        全量重建: 建一个带版本号的新索引, 写入期间不刷新、不要副本
+        :return: 新索引的名字
+        """
+        db_name_address = self._configService.get_es_cnf("db_name_address")
+        index_name = db_name_address + "_" + datetime.now().strftime("%Y%m%d%H%M%S")
+
+        es_cli = self.__create_es_cli()
+        # 记下现在的副本数, 重建完成后恢复
+        self._rebuild_replicas = es_cli.get_index_setting(db_name_address, "number_of_replicas", 1)
+        es_cli.create_with_settings(index_name, {"refresh_interval": "-1", "number_of_replicas": 0})
+        es_cli.close()
+        log.info("开始重建ES索引: " + index_name)
+        return index_name
+
+    def finish_rebuild(self, index_name):
+        """
+        合并段、恢复刷新和副本, 然后把别名（db_name_address）切换到新索引, 删掉旧索引。
+        切换别名之前出错会抛出异常, 别名还指向旧索引, 调用方可以 abort_rebuild
+        """
+        db_name_address = self._configService.get_es_cnf("db_name_address")
+
+        es_cli = self.__create_es_cli()
+        try:
+            es_cli.refresh(index_name)
+            es_cli.force_merge(index_name)
+            es_cli.put_settings(index_name, {"refresh_interval": None,
+                                             "number_of_replicas": int(self._rebuild_replicas)})
+            old_indices = es_cli.swap_alias(db_name_address, index_name)
+            # 别名已经切到新索引, 后面出错不能再 abort_rebuild 删新索引, 旧索引删不掉只记日志
+            for old_index in old_indices:
+                try:
+                    es_cli.deleteIndex(old_index)
+                except Exception as e:
+                    log.error("删除旧索引 " + old_index + " 失败 => " + str(e))
+        finally:
+            es_cli.close()
+        log.info("ES索引重建完成, " + db_name_address + " -> " + index_name)
 
-        es_cli = ElasticsearchManger(db_name_address, schemaMain, ip, port, username, password)
+    def abort_rebuild(self, index_name):
+        """
+        删掉重建到一半的新索引, 删不掉只记日志, 不影响旧索引
+        """
+        es_cli = self.__create_es_cli()
+        try:
+            es_cli.deleteIndex(index_name)
+        except Exception as e:
+            log.error("删除重建的索引 " + index_name + " 失败 => " + str(e))
+        finally:
+            es_cli.close()
+
+    def create_scripts(self):
+        es_cli = self.__create_es_cli()
         with es_cli as es_conn:
             if es_conn is None:
                 return
-        succeed = es_cli.put_script(self._score_script_id, SEARCH_SCORE_SCRIPT)
+        script_id, script, _ = get_baked_score_script(self._score_script_id, bool(self._multi_region),
+                                                      self._region_field, self._street_field)
+        # id 里带了脚本内容的hash, 已存在且内容一致就不用重新编译
+        stored = es_cli.get_script(script_id)
+        if stored is not None and stored.get("source") == script["script"]["source"]:
+            return
+        log.info("创建ES评分脚本: " + script_id)
+        succeed = es_cli.put_script(script_id, script)
         if not succeed:
-            raise Exception("创建ES脚本失败")
+            raise Exception("创建ES脚本失败: " + script_id)
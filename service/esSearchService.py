@@ -1,11 +1,15 @@
+import asyncio
 import copy
+from concurrent.futures import ThreadPoolExecutor
 
 from pySimpleSpringFramework.spring_core.log import log
 from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import Component, Scope
 from pySimpleSpringFramework.spring_core.type.annotation.methodAnnotation import Autowired, Value
 
 from addressSearch.es.elasticsearchManger import ElasticsearchManger
-from addressSearch.es.schemas import schemaMain, es_fullname_field
+from addressSearch.es.schemas import schemaMain, es_fullname_field, es_schema_search_segments, es_source_profiles, \
+    es_schema_number_fields
+from addressSearch.enums.dbOperator import RestRet
 from addressSearch.mapping.addressMapping import AddressMapping
 from addressSearch.service.addressParseService import AddressParseService
 from addressSearch.service.configService import ConfigService
@@ -17,16 +21,21 @@ from addressSearch.utils.commonTool import CommonTool
 @Component
 @Scope("prototype")
 class EsSearchService:
+    # 同义词替换后的地址一起调用AI服务用的线程池, 所有实例共用
+    __SEARCH_WORKERS = 16
+    __ai_executor = ThreadPoolExecutor(max_workers=__SEARCH_WORKERS, thread_name_prefix="address_ai")
+    # es返回结果只保留命中的这几部分
+    __HIT_FILTER_PATH = ["hits.hits._id", "hits.hits._score", "hits.hits._source"]
+
     @Value({
         "project.print_debug": "_print_debug",
+        "project.search.source_profile": "_source_profile",
         "project.blur_search": "_blur_search",
-        "project.score_script_id": "_score_script_id",
         "project.local_config.address_max_return": "_address_max_return"
     })
     def __init__(self):
         self._print_debug = False
         self._blur_search = 0
-        self._score_script_id = None
         self._address_table = None
         self._parsed_address_table = None
         self._ip = None
@@ -44,10 +53,9 @@ class EsSearchService:
         self._address_max_return = 20
         self._return_multi = False
         self._es_cli = None
-        self._multi_region = False
-        self._region_field = None
-        self._street_field = None
         self._build_number_tolerance = 20  # 前后n栋的来去
+        # 返回的 _source 字段范围, 见 es_source_profiles
+        self._source_profile = "dev"
 
     def _after_init(self):
         self._address_table = self._configService.get_addr_cnf("data_table")
@@ -68,7 +76,7 @@ class EsSearchService:
         # self._es_cli = ElasticsearchManger(self._db_name_address, schemaMainNew, self._ip, self._port)
 
         self._es_cli = ElasticsearchManger(self._db_name_address, schemaMain, self._ip, self._port, self._username,
-                                           self._password)
+                                           self._password, shared=True)
         with self._es_cli as es_conn:
             if es_conn is None:
                 return
@@ -80,6 +88,20 @@ class EsSearchService:
     def set_return_multi(self):
         self._return_multi = True
 
+    def set_source_profile(self, profile):
+        if profile not in es_source_profiles:
+            raise ValueError("未知的 _source 配置: " + str(profile))
+        self._source_profile = profile
+
+    def __decorate_search_param(self, search_param):
+        """
+        只取需要的 _source 字段; 只要第一条时不统计总数
+        """
+        search_param["_source"] = es_source_profiles[self._source_profile]
+        if not self._return_multi:
+            search_param["track_total_hits"] = False
+        return search_param
+
     @Autowired
     def set_params(self,
                    addressMapping: AddressMapping,
@@ -127,24 +149,55 @@ class EsSearchService:
 
     def _run_address_search_by_thesaurus(self, address_string):
         """
-        使用同义词通过地名地址匹配    
+        使用同义词通过地名地址匹配。 所有替换后的地址一起识别, 一次msearch, 取分数最高的
+        """
+        variants = self._thesaurusService.make_variants(address_string)
+        if len(variants) == 0:
+            return False, {}
+
+        results = list(self.__ai_executor.map(self._aiModelService.run_by_session, variants))
+
+        search_params, variant_idx_list = self.__create_variant_search_params(variants, results)
+        if len(search_params) == 0:
+            return False, {}
+
+        try:
+            responses = self._es_cli.msearch(search_params, self.__HIT_FILTER_PATH)
+        except Exception as e:
+            log.error(str(e))
+            return False, {}
+        return self.__pick_variant_result(variant_idx_list, responses)
+
+    def __create_variant_search_params(self, variants, results):
+        """
+        所有地址的所有模糊程度放在一起查询，记录每个查询属于哪个地址
+        """
+        if self._print_debug:
+            print("同义词替换: " + str(variants))
+
+        search_params = []
+        variant_idx_list = []
+        for i, result in enumerate(results):
+            params = self.__create_address_search_params(result)
+            search_params.extend(params)
+            variant_idx_list.extend([i] * len(params))
+        return search_params, variant_idx_list
+
+    def __pick_variant_result(self, variant_idx_list, responses):
+        """
+        每个地址取最精确的有结果的那个, 再取所有地址中分数最高的
         """
-        ls = [self._thesaurusService.s2t, self._thesaurusService.t2s]
-
-        for d in ls:
-            for k, words in d.items():
-                if address_string.find(k) >= 0:
-                    for word in words:
-                        # 一对同义词出现在一个地址中。 比如: 机场路133号格林东方酒店6楼。  机场路133号 -> 格林东方酒店
-                        if address_string.find(word) >= 0:
-                            address_string = address_string.replace(k, "")
-                        # 同义词互换
-                        else:
-                            address_string = address_string.replace(k, word)
-                        succeed, result = self._run_address_search_not_by_thesaurus(address_string)
-                        if succeed:
-                            return succeed, result
-        return False, {}
+        best = (False, {})
+        found_variants = set()
+        for variant_idx, response in zip(variant_idx_list, responses):
+            if variant_idx in found_variants:
+                continue
+            succeed, result = self._get_query_result(response)
+            if not succeed:
+                continue
+            found_variants.add(variant_idx)
+            best = self.__better_result(best, (succeed, result))
+        return best
 
     @staticmethod
     def __real_succeed(score):
@@ -157,49 +210,137 @@ class EsSearchService:
             succeed, result = self._run_address_search_by_thesaurus(address_string)
         return succeed, result
 
+    @staticmethod
+    def __result_score(succeed, result):
+        if not succeed:
+            return 0
+        # 返回多个时第1个分数最高
+        if isinstance(result, list):
+            return result[0]["score"] if len(result) > 0 else 0
+        return result["score"]
+
+    def __better_result(self, first, second):
+        """
+        取分数高的那个
+        """
+        if self.__result_score(*second) > self.__result_score(*first):
+            return second
+        return first
+
     def run_address_search_by_score(self, address_string):
         # 只要返回最高分数的那条
         self._address_max_return = 1
 
         succeed, result = self.run_address_search(address_string)
-        score = 0
-        if succeed:
-            score = result["score"]
-        if not self.__real_succeed(score):
-            succeed2, result2 = self.run_address_search(address_string, True)
-            if succeed2:
-                score2 = result2["score"]
-                if score2 > score:
-                    result = result2
+        if not self.__real_succeed(self.__result_score(succeed, result)):
+            succeed, result = self.__better_result((succeed, result), self.run_address_search(address_string, True))
         return succeed, result
 
+    @staticmethod
+    def __make_segment_clauses(result, fields):
+        clauses = []
+        for field in fields:
+            value = result.get(field)
+            if value is None or str(value) == "":
+                continue
+            if field in es_schema_number_fields:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    continue
+            clauses.append({"term": {field: value}})
+        return clauses
+
+    @staticmethod
+    def __is_anchor_clause(clause):
+        """
+        不是门牌、单元、楼层这些数字的条件
+        """
+        return next(iter(clause["term"])) not in es_schema_number_fields
+
+    def __anchored_segments(self, segments, count):
+        """
+        取最细的 count 段。 这几段只有数字时单独匹配没有意义,
+        加上前面最近的有道路、兴趣点或者行政区划的那一段里的这些条件
+        """
+        clauses = [clause for clauses in segments[-count:] for clause in clauses]
+        if any(self.__is_anchor_clause(clause) for clause in clauses):
+            return clauses
+
+        for previous in reversed(segments[:-count]):
+            anchors = [clause for clause in previous if self.__is_anchor_clause(clause)]
+            if len(anchors) > 0:
+                return anchors + clauses
+        return clauses
+
     def __create_address_search_params(self, result):
         """
-        生成搜索参数
+        生成搜索参数。 按模糊程度生成多个，匹配段数越多的分数越高、越靠前
         """
-        search_params = None
+        search_params = []
+        if result is None or result.get("code", RestRet.SUCCEED.value) == RestRet.FAILED.value:
+            return search_params
+
+        segments = [self.__make_segment_clauses(result, fields) for fields in es_schema_search_segments]
+        segments = [clauses for clauses in segments if len(clauses) > 0]
+        if len(segments) == 0:
+            return search_params
+
+        # 匹配全部段, 匹配后2段, 只匹配最细的那段
+        search_list1 = [clause for clauses in segments for clause in clauses]
+        search_list2 = self.__anchored_segments(segments, 2)
+        search_list3 = self.__anchored_segments(segments, 1)
+
+        search_query = self._get_query_dict(search_list1, search_list2, search_list3)
+        if len(search_query) == 0:
+            # 不模糊查询, 全部段都要匹配上
+            search_query = {"100": search_list1}
+
+        for score, clauses in search_query.items():
+            search_params.append(self.__decorate_search_param({
+                "query": {
+                    "constant_score": {
+                        "filter": {"bool": {"filter": clauses}},
+                        "boost": float(score)
+                    }
+                },
+                "size": int(self._address_max_return)
+            }))
         return search_params
 
     def __address_search(self, search_params):
+        """
+        所有模糊程度的查询一次发给es, 取最精确的那个有结果的
+        """
         succeed = False
         search_result = {}
 
         if len(search_params) == 0:
             return succeed, search_result
 
-        for search_param in search_params:
-            if self._print_debug:
-                # print("======", str(search_param))
-                # print("search_param :" + str(search_param["query"]["function_score"]["query"]))
+        if self._print_debug:
+            for search_param in search_params:
                 print("search_param :" + str(search_param))
-            succeed, search_result = self._do_address_search(search_param)
+
+        try:
+            responses = self._es_cli.msearch(search_params, self.__HIT_FILTER_PATH)
+        except Exception as e:
+            log.error(str(e))
+            return succeed, search_result
+        return self.__pick_tier_result(responses)
+
+    def __pick_tier_result(self, responses):
+        succeed = False
+        search_result = {}
+        for response in responses:
+            succeed, search_result = self._get_query_result(response)
             if succeed:
                 break
         return succeed, search_result
 
     def _do_address_search(self, search_param):
         try:
-            search_result = self._es_cli.query(search_param)
+            search_result = self._es_cli.query(search_param, self.__HIT_FILTER_PATH)
             return self._get_query_result(search_result)
         except Exception as e:
             log.error(str(e))
@@ -228,6 +369,62 @@ class EsSearchService:
 
         return search_query
 
+    # ============================ 异步 ============================
+    async def _run_address_search_not_by_thesaurus_async(self, address_string):
+        result = await self._aiModelService.run_async(address_string)
+
+        search_params = self.__create_address_search_params(result)
+        if len(search_params) == 0:
+            return False, {}
+        if self._print_debug:
+            for search_param in search_params:
+                print("search_param :" + str(search_param))
+
+        responses = await self._es_cli.msearch_async(search_params, self.__HIT_FILTER_PATH)
+        return self.__pick_tier_result(responses)
+
+    async def _run_address_search_by_thesaurus_async(self, address_string):
+        variants = self._thesaurusService.make_variants(address_string)
+        if len(variants) == 0:
+            return False, {}
+
+        results = await asyncio.gather(*[self._aiModelService.run_async(variant) for variant in variants])
+
+        search_params, variant_idx_list = self.__create_variant_search_params(variants, results)
+        if len(search_params) == 0:
+            return False, {}
+
+        responses = await self._es_cli.msearch_async(search_params, self.__HIT_FILTER_PATH)
+        return self.__pick_variant_result(variant_idx_list, responses)
+
+    async def run_address_search_async(self, address_string):
+        succeed, result = await self._run_address_search_not_by_thesaurus_async(address_string)
+        # 还是未找到的話，使用同义词
+        if not succeed:
+            succeed, result = await self._run_address_search_by_thesaurus_async(address_string)
+        return succeed, result
+
+    async def run_address_search_by_score_async(self, address_string):
+        """
+        和 run_address_search_by_score 一样, AI服务和es都是异步请求。
+        同步版本第二次查询只是换成长连接再请求一次AI服务, 结果相同, 这里不再重复
+        """
+        # 只要返回最高分数的那条
+        self._address_max_return = 1
+        return await self.run_address_search_async(address_string)
+
+    async def run_search_by_point_async(self, points_string: str, buff_distance: int):
+        points = points_string.split(",")
+        x = str(points[0]).strip()
+        y = str(points[1]).strip()
+
+        search_param = self._make_point_search_param(x=x, y=y, buff_distance=buff_distance)
+        if self._print_debug:
+            print("search_param = ", search_param)
+
+        search_result = await self._es_cli.query_async(search_param, self.__HIT_FILTER_PATH)
+        return self._get_query_result(search_result)
+
     def _make_point_search_param(self, x, y, buff_distance):
         """
         坐标查询
@@ -237,7 +434,7 @@ class EsSearchService:
         :return:
         """
         buff_distance = buff_distance if buff_distance <= self._max_distance else self._max_distance
-        return {
+        return self.__decorate_search_param({
             "query": {
                 "geo_distance": {
                     "distance": str(float(buff_distance) / 1000) + "km",
@@ -261,7 +458,7 @@ class EsSearchService:
                 }
             ],
             "size": int(self._address_max_return)
-        }
+        })
 
     def run_search_by_point(self, points_string: str, buff_distance: int):
         """
@@ -276,7 +473,7 @@ class EsSearchService:
         if self._print_debug:
             print("search_param = ", search_param)
 
-        search_result = self._es_cli.query(search_param)
+        search_result = self._es_cli.query(search_param, self.__HIT_FILTER_PATH)
         result = self._get_query_result(search_result)
 
         return result
@@ -288,13 +485,12 @@ class EsSearchService:
         if search_result is None:
             return False, {}
 
-        search_count = int(search_result.get("hits").get("total").get("value"))
+        # 不统计总数、并且过滤了返回内容, 没有命中时 hits 可能不存在
+        items = search_result.get("hits", {}).get("hits", [])
         if self._print_debug:
-            print("找到数量 = " + str(search_count))
-        if search_count <= 0:
+            print("找到数量 = " + str(len(items)))
+        if len(items) == 0:
             return False, {}
-
-        items = search_result.get("hits").get("hits")
         # 返回多个
         if self._return_multi:
             results = []
@@ -310,35 +506,3 @@ class EsSearchService:
         result["score"] = items[0].get("_score")
         result["id"] = items[0].get("_id")
         return True, result
-
-    def _get_score_script(self, region, street, sections_fir, sections_mid, sections_last, building_number):
-        if sections_fir is None:
-            sections_fir = {}
-        if sections_mid is None:
-            sections_mid = {}
-        if sections_last is None:
-            sections_last = {}
-
-        script = {
-            "script_score": {
-                "script": {
-                    "id": self._score_script_id,
-                    "params": {
-                        "multi_region": 1 if self._multi_region else 0,
-                        "region_field": self._region_field,
-                        "region_value": region if region is not None else "",
-                        "street_field": self._street_field,
-                        "street_value": street if street is not None else "",
-                        "query_fields_fir": es_schema_fields_fir,
-                        "query_fields_mid": es_schema_fields_mid,
-                        "query_fields_last": es_schema_fields_last,
-                        "query_field_building_number": es_schema_field_building_number,
-                        "query_value_building_number": building_number,
-                        "query_value_fir": list(sections_fir.values()),
-                        "query_value_mid": list(sections_mid.values()),
-                        "query_value_last": list(sections_last.values())
-                    }
-                }
-            }
-        }
-        return script
@@ -0,0 +1,55 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import Component
+
+from addressSearch.utils.histogram import Histogram
+
+
+@Component
+class ParseMetricsService:
+    """
+    地址解析各步骤的耗时统计（毫秒）和计数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, millis, count=1):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(millis, count)
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    @contextmanager
+    def timer(self, name, count=1):
+        """
+        统计一步的耗时。 批量处理时 count 为地址数量，记录的是每个地址的平均耗时
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if count > 0:
+                millis = (time.perf_counter() - start) * 1000
+                self.observe(name, millis / count, count)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {name: histogram.to_dict() for name, histogram in self._histograms.items()},
+                "counters": dict(self._counters)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
@@ -14,6 +14,7 @@ from addressSearch.es.elasticsearchManger import ElasticsearchManger
 from addressSearch.es.schemas import schemaMain, es_fullname_field, add_schema_field
 from addressSearch.mapping.addressMapping import AddressMapping
 from addressSearch.service.configService import ConfigService
+from addressSearch.service.esInitService import EsInitService
 from addressSearch.utils.commonTool import CommonTool
 
 
@@ -44,6 +45,7 @@ class PostDataToEsService:
         self._ID_FIELD_NAME = "id"
         self._address_field_name = None
         self._executorTaskManager = None
+        self._esInitService = None
         self._address_ex_fields = []
 
     @Autowired
@@ -51,9 +53,11 @@ class PostDataToEsService:
                    addressMapping: AddressMapping,
                    executorTaskManager: ExecutorTaskManager,
                    postDataToEsService,
-                   configService: ConfigService
+                   configService: ConfigService,
+                   esInitService: EsInitService
                    ):
         self._addressMapping = addressMapping
+        self._esInitService = esInitService
         self._self = postDataToEsService
         self._executorTaskManager = executorTaskManager
         self._configService = configService
@@ -71,28 +75,32 @@ class PostDataToEsService:
         self._es_init()
 
     @Transactional()
-    def do_run(self, df, progress_bar=None):
+    def do_run(self, df, progress_bar=None, index_name=None, rebuild=False):
+        """
+        :param index_name: 写入的索引, 默认为 db_name_address
+        :param rebuild: 全量重建, 所有数据都按新增处理
+        """
         df.columns = df.columns.str.lower()
 
-        es = ElasticsearchManger(self._db_name, schemaMain, self._ip, self._port, self._username, self._password)
+        es = ElasticsearchManger(index_name if index_name is not None else self._db_name, schemaMain, self._ip,
+                                 self._port, self._username, self._password)
         if es is None:
             log.error("当前线程连接elasticSearch服务器失败")
             return
 
-        ids = []
+        actions = []
         for row in df.itertuples():
-            flag = int(getattr(row, "op_flag"))
+            flag = DBOperator.INSERT.value if rebuild else int(getattr(row, "op_flag"))
 
             dataId = getattr(row, self._ID_FIELD_NAME)
 
             # 删除
             if flag == DBOperator.DELETE.value:
-                ids.append(dataId)
-                es.delete(dataId)
+                actions.append(("delete", dataId, None))
                 continue
 
-            # 新增或更新
-            if flag == DBOperator.INSERT.value or flag == DBOperator.UPDATE.value:
+            # 新增或更新, 以及上次写入es失败的（删除失败的不会改成3, 所以这里都是新增或更新）
+            if flag in (DBOperator.INSERT.value, DBOperator.UPDATE.value, DBOperator.INSERT_ES_FAILED.value):
                 # 新增 和 修改 是一样的
                 data_dict = {}
                 for fieldName in schemaMain["mappings"]["properties"].keys():
@@ -145,16 +153,28 @@ class PostDataToEsService:
                 for k in delKeyList:
                     del data_dict[k]
 
-                # 入库
-                try:
-                    es.insert(dataId, data_dict)
-                    ids.append(dataId)
-                except Exception as e:
-                    log.error(f"es.insert error:{str(e)}, dataId={str(dataId)}, dict={str(e)}")
-                    self._addressMapping.set_insert_es_failed(self._parsed_address_table, dataId)
-
-        if len(ids) > 0:
-            self._self.set_waiting_completed(ids)
+                actions.append(("index", dataId, data_dict))
+
+        # 批量入库。 连不上es会抛出异常, 整批不改状态
+        failed_id_set = set(es.bulk(actions))
+        completed_ids = []
+        deleted_ids = []
+        failed_index_ids = []
+        for op, dataId, _ in actions:
+            if dataId in failed_id_set:
+                # 新增、更新失败的标记为3, 下次按新增重新写入。 删除失败的保持2, 下次重新删除
+                if op == "index":
+                    failed_index_ids.append(dataId)
+            elif op == "delete":
+                deleted_ids.append(dataId)
+            else:
+                completed_ids.append(dataId)
+
+        for table_ids in CommonTool.split_sql_in_values(failed_index_ids):
+            self._addressMapping.set_insert_es_failed_batch(self._parsed_address_table, table_ids)
+
+        if len(completed_ids) > 0 or len(deleted_ids) > 0:
+            self._self.set_waiting_completed(completed_ids, deleted_ids)
 
         if progress_bar is not None:
             progress_bar.update(len(df))
@@ -162,9 +182,15 @@ class PostDataToEsService:
         return len(df)
 
     @Transactional(propagation=Propagation.REQUIRES_NEW)
-    def set_waiting_completed(self, ids):
-        for tId in ids:
-            self._addressMapping.set_completed(self._parsed_address_table, tId)
+    def set_waiting_completed(self, ids, deleted_ids=None):
+        """
+        :param ids: 写入es成功的, 改成完成
+        :param deleted_ids: 从es删除成功的, 解析表中也删掉, 全量重建时不会再写回es
+        """
+        for table_ids in CommonTool.split_sql_in_values(ids):
+            self._addressMapping.set_completed_batch(self._parsed_address_table, table_ids)
+        for table_ids in CommonTool.split_sql_in_values(deleted_ids or []):
+            self._addressMapping.delete_data_batch(self._parsed_address_table, table_ids)
 
     # def start_by_thread(self):
     #     progress_bar = tqdm(total=0, position=0, leave=True,
@@ -202,7 +228,38 @@ class PostDataToEsService:
     #
     #     return False
 
-    def start_by_thread_df(self, df):
+    def rebuild(self):
+        """
+        全量重建es: 写到新的索引里, 完成后再把别名切换过去, 重建过程中搜索仍然使用旧索引
+        """
+        index_name = self._esInitService.begin_rebuild()
+        try:
+            last_id = ""
+            count = 0
+            while True:
+                df = self._addressMapping.get_parsed_data_after(self._parsed_address_table, last_id,
+                                                                self._batch_size * self._max_core)
+                if df is None or len(df) == 0:
+                    break
+                last_id = df[self._ID_FIELD_NAME].iloc[-1]
+                count += len(df)
+                if not self.start_by_thread_df(df, index_name, True):
+                    raise Exception("写入es失败")
+                print(f"===== 重建es索引 {index_name}, 已写入: {count} =====")
+        except Exception as e:
+            log.error("rebuild => " + str(e))
+            self._esInitService.abort_rebuild(index_name)
+            return False
+
+        try:
+            self._esInitService.finish_rebuild(index_name)
+        except Exception as e:
+            log.error("rebuild finish => " + str(e))
+            self._esInitService.abort_rebuild(index_name)
+            return False
+        return True
+
+    def start_by_thread_df(self, df, index_name=None, rebuild=False):
         try:
             batch = int(len(df) / self._batch_size)
             batch += int(0 if len(df) % self._batch_size == 0 else 1)
@@ -213,7 +270,10 @@ class PostDataToEsService:
                 future = self._executorTaskManager.submit(self._self.do_run,
                                                           False,
                                                           self.callback_function,
-                                                          df_tmp)
+                                                          df_tmp,
+                                                          None,
+                                                          index_name,
+                                                          rebuild)
                 if future is not None:
                     futures.append(future)
 
@@ -3,14 +3,14 @@ from pySimpleSpringFramework.spring_core.log import log
 from pySimpleSpringFramework.spring_core.task.executorTaskManager import ExecutorTaskManager
 from pySimpleSpringFramework.spring_core.type.annotation.classAnnotation import Component
 from pySimpleSpringFramework.spring_core.type.annotation.methodAnnotation import Autowired, Value
-from pySimpleSpringFramework.spring_core.type.annotationType import Propagation
-from pySimpleSpringFramework.spring_orm.annoation.dataSourceAnnotation import Transactional
 from pySimpleSpringFramework.spring_orm.databaseManager import DatabaseManager
+from sqlalchemy import bindparam, text
 from tqdm import tqdm
 from addressSearch.enums.dbOperator import DBOperator, RestRet
 from addressSearch.mapping.addressMapping import AddressMapping
 from addressSearch.service.configService import ConfigService
 from addressSearch.service.aiModelService import AiModelService
+from addressSearch.utils.bulkWriter import BulkWriter
 from addressSearch.utils.commonTool import CommonTool
 
 
@@ -79,16 +79,35 @@ class ResolveToDBService:
         self._address_table = self._configService.get_addr_cnf("data_table")
         self._parsed_address_table = self._configService.get_addr_cnf("data_table_parsed")
 
-    def _do_parsed_result(self, data, if_exists='append'):
-        df = pd.DataFrame(data)
-        self._databaseManager.execute_by_df(df, self._parsed_address_table, if_exists)
+    @staticmethod
+    def __update_batch(conn, sql, table, ids):
+        """
+        一条sql更新一批id。 id 用绑定参数, 每次最多 BulkWriter.IN_SIZE 个
+        """
+        if len(ids) == 0:
+            return
+        stmt = text(sql.format(table=table)).bindparams(bindparam("ids", expanding=True))
+        for i in range(0, len(ids), BulkWriter.IN_SIZE):
+            conn.execute(stmt, {"ids": ids[i:i + BulkWriter.IN_SIZE]})
+
+    def _write_results(self, data, ids_completed, ids_delete, ids_unable_parsed):
+        """
+        解析结果和状态更新在同一个连接、同一个事务里写入, 任何一步失败整批回滚。
+        新增、修改、删除后重新新增 都按 id 整行替换:
+        PostgreSQL 用 COPY 到临时表再 DELETE USING + INSERT, 其他数据库同一事务里先删再 executemany
+        """
+        with self._databaseManager.engine.begin() as conn:
+            if len(data) > 0:
+                BulkWriter.upsert_df(pd.DataFrame(data), self._parsed_address_table, conn, self._ID_FIELD_NAME)
+            self.__update_batch(conn, "update {table} set op_flag=9, is_del=0 where id in :ids",
+                                self._address_table, ids_completed)
+            self.__update_batch(conn, "update {table} set op_flag=2 where id in :ids",
+                                self._parsed_address_table, ids_delete)
+            self.__update_batch(conn, "update {table} set op_flag=9, is_del=1 where id in :ids",
+                                self._address_table, ids_delete)
+            self.__update_batch(conn, "update {table} set op_flag=7 where id in :ids",
+                                self._address_table, ids_unable_parsed)
 
-    @Transactional(propagation=Propagation.REQUIRES_NEW)
-    def delete_data(self, ids):
-        for tId in ids:
-            self._addressMapping.delete_data(self._parsed_address_table, tId)
-
-    @Transactional()
     def do_run(self, df, is_participle_continue=False, progress_bar=None):
         is_parsed = False
 
@@ -158,48 +177,21 @@ class ResolveToDBService:
                 for ex_field in self._address_ex_fields:
                     result[ex_field] = row[ex_field]
 
-            # 新增
-            if len(data_insert) > 0:
-                self._do_parsed_result(data=data_insert)
-                for tId in ids_insert:
-                    self._addressMapping.set_notDelete_and_completed(self._address_table, tId)
-
-            # 修改
-            if len(data_modify) > 0:
-                # 修改太麻烦，这里使用先删再插。
-                self._self.delete_data(ids_update)
-                self._do_parsed_result(data=data_modify)
-
-                for tId in ids_update:
-                    self._addressMapping.set_notDelete_and_completed(self._address_table, tId)
-
-            # 删除
-            if len(ids_delete) > 0:
-                for tId in ids_delete:
-                    self._addressMapping.set_deleted(self._parsed_address_table, tId)
-                    self._addressMapping.set_delete_and_completed(self._address_table, tId)
-
-            # 无法解析
-            if len(ids_unable_parsed) > 0:
-                for tId in ids_unable_parsed:
-                    self._addressMapping.set_unable_parsed(self._address_table, tId)
+            # 新增和修改 一起写入, 同时更新状态
+            data = data_insert + data_modify
+            ids_completed = ids_insert + ids_update if len(data) > 0 else []
+            self._write_results(data, ids_completed, ids_delete, ids_unable_parsed)
 
             is_parsed = True
         except Exception as e:
-            # 违反唯一性约束， 主键重复了.  这里直接删掉那个记录
-            if str(e).find('psycopg2.errors.UniqueViolation') >= 0:
-                for data in data_insert:
-                    tId = data[self._ID_FIELD_NAME]
-                    self._addressMapping.delete_row(self._parsed_address_table, tId)
-            else:
-                log.error("ResolveToDBService do_run error => " + str(e))
+            log.error("ResolveToDBService do_run error => " + str(e))
 
-                ls = []
-                for data in data_insert:
-                    ls.append(data[self._ID_FIELD_NAME])
-                log.error("ResolveToDBService error ids => " + str(ls))
+            ls = []
+            for data in data_insert + data_modify:
+                ls.append(data[self._ID_FIELD_NAME])
+            log.error("ResolveToDBService error ids => " + str(ls))
 
-                raise Exception(e)
+            raise Exception(e)
 
         if progress_bar is not None and is_parsed:
             progress_bar.update(do_count)
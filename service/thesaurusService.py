@@ -4,6 +4,7 @@ from pySimpleSpringFramework.spring_orm.databaseManager import DatabaseManager
 
 from addressSearch.mapping.configMapping import ConfigMapping
 from addressSearch.service.configService import ConfigService
+from addressSearch.utils.wordTrie import WordTrie
 
 
 @Component
@@ -17,6 +18,8 @@ class ThesaurusService:
         self._databaseManager = None
         self.s2t = {}
         self.t2s = {}
+        # 所有同义词的前缀树, 一次扫描找出地址中出现的同义词
+        self._matcher = WordTrie()
 
     @Autowired
     def set_params(self, configMapping: ConfigMapping,
@@ -51,3 +54,34 @@ class ThesaurusService:
             else:
                 self.t2s[t].append(s)
 
+        self._matcher = WordTrie(list(self.s2t.keys()) + list(self.t2s.keys()))
+
+    def __find_words(self, address_string):
+        return set(word for _, word in self._matcher.iter_matches(address_string))
+
+    def make_variants(self, address_string):
+        """
+        生成同义词替换后的地址，顺序和逐个替换时一样。
+        替换是累加的, 替换后可能出现新的同义词, 所以每次替换后重新找一遍
+        :param address_string:
+        :return: 替换后的地址列表
+        """
+        found = self.__find_words(address_string)
+        if len(found) == 0:
+            return []
+
+        variants = []
+        for d in [self.s2t, self.t2s]:
+            for k, words in d.items():
+                if k not in found:
+                    continue
+                for word in words:
+                    # 一对同义词出现在一个地址中。 比如: 机场路133号格林东方酒店6楼。  机场路133号 -> 格林东方酒店
+                    if address_string.find(word) >= 0:
+                        address_string = address_string.replace(k, "")
+                    # 同义词互换
+                    else:
+                        address_string = address_string.replace(k, word)
+                    variants.append(address_string)
+                found = self.__find_words(address_string)
+        return variants
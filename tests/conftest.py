@@ -0,0 +1,9 @@
+import os
+import sys
+import types
+
+# 代码里都是 from addressSearch.xxx import, 把仓库目录注册成 addressSearch 包, 不依赖检出的目录名
+if "addressSearch" not in sys.modules:
+    _package = types.ModuleType("addressSearch")
+    _package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules["addressSearch"] = _package
@@ -0,0 +1,128 @@
+"""
+ScoreCalculator 和 es 评分脚本 (scripts.SEARCH_SCORE_SCRIPT) 的一致性测试。
+期望值都是按 painless 脚本手算的:
+    score = 全部找到 ? 100 : min(50 + fir + mid + last, 100)
+    返回 (int)score + fir_score_de + mid_score_de + last_score_de (+ multi_region 时的区、街道减分)
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from addressSearch.entity.parseResult import ParseResult
+from addressSearch.es.scoreCalculator import ScoreCalculator
+
+
+def _score(parse_result, docs, calculator=None):
+    calculator = calculator if calculator is not None else ScoreCalculator()
+    return [float(v) for v in calculator.score(parse_result, docs)]
+
+
+def test_all_found():
+    # 每段都全部找到, 直接 100
+    parse_result = ParseResult(True, fir=["A"], main="M", mid=["1", "2"], last=["x"])
+    doc = {"fir_1": "A", "f_main": "M", "mid_1": "1", "mid_2": "2", "last_1": "x"}
+    assert _score(parse_result, [doc]) == [100.0]
+
+
+def test_partial_found():
+    # fir 找到1个: 5
+    # mid 2个值, avg = 20 / 2 = 10, mid_1 对上、mid_2 没对上: 10 * 1 + 3 = 13
+    # last 没找到: 0
+    # 50 + 5 + 13 + 0 = 68, 每段的值都不比查询的多, 不减分
+    parse_result = ParseResult(True, fir=["A", "B"], main="M", mid=["1", "2"], last=["x"])
+    doc = {"fir_1": "A", "f_main": "M", "mid_1": "1", "mid_2": "3", "last_1": "y"}
+    assert _score(parse_result, [doc]) == [68.0]
+
+
+def test_mid_1_is_positional():
+    # mid_1 必须对应第1个查询值, 后面的位置任意匹配
+    # mid_1 = "2" 不等于 "1": 0 分; mid_2 = "1" 只和第2个以后的查询值 ["2"] 比, 也没找到
+    # 50 + 0 + 0 + 0 = 50
+    parse_result = ParseResult(True, main="M", mid=["1", "2"])
+    doc = {"f_main": "M", "mid_1": "2", "mid_2": "1"}
+    assert _score(parse_result, [doc]) == [50.0]
+
+    # mid_1 不对, mid_2 对: avg 10 * 1 = 10, 没有 mid_1 的 +3
+    doc = {"f_main": "M", "mid_1": "9", "mid_2": "2"}
+    assert _score(parse_result, [doc]) == [60.0]
+
+
+def test_extra_value_deductions():
+    # 全部找到: 100
+    # fir 多了2个: (1 - 3) * 5 = -10
+    # mid 多了1个: (2 - 3) * (20 / 3) = -6.666...
+    # last 多了: -4
+    parse_result = ParseResult(True, fir=["A"], main="M", mid=["1", "2"], last=["x"])
+    doc = {"fir_1": "A", "fir_2": "B", "fir_3": "C", "f_main": "M",
+           "mid_1": "1", "mid_2": "2", "mid_3": "9",
+           "last_1": "x", "last_2": "z"}
+    assert _score(parse_result, [doc]) == pytest.approx([100 - 10 - 20.0 / 3 - 4])
+
+
+def test_deductions_without_query_values():
+    # 查询没有 fir, 文档有 fir 也要减分
+    # mid 2个值找到 mid_1: 10 + 3 = 13: 50 + 13 = 63
+    # fir 多了1个: (0 - 1) * 5 = -5, mid 多了1个: (2 - 3) * (20 / 3)
+    parse_result = ParseResult(True, main="M", mid=["1", "2"], last=[])
+    doc = {"fir_1": "A", "f_main": "M", "mid_1": "1", "mid_2": "8", "mid_3": "9"}
+    assert _score(parse_result, [doc]) == pytest.approx([63 - 5 - 20.0 / 3])
+
+
+def test_single_mid_uses_building_number():
+    # mid 只有1个值的时候比对楼栋号, 不比对 mid_1 的值
+    parse_result = ParseResult(True, main="M", mid=["5栋"], building_number=5)
+    docs = [
+        # 楼栋号相同: 全部找到 100
+        {"f_main": "M", "mid_1": "五栋", "building_number": 5},
+        # 从解析表读出来的楼栋号可能是浮点数
+        {"f_main": "M", "mid_1": "5栋", "building_number": 5.0},
+        # 楼栋号不同: 50 + 0
+        {"f_main": "M", "mid_1": "5栋", "building_number": 6},
+        # 楼栋号不同, mid 多了1个: 50 + (1 - 2) * (20 / 2) = 40
+        {"f_main": "M", "mid_1": "6栋", "mid_2": "1单元", "building_number": 6},
+    ]
+    assert _score(parse_result, docs) == [100.0, 100.0, 50.0, 40.0]
+
+
+def test_multi_region_deductions():
+    calculator = ScoreCalculator(True, "district", "town")
+    parse_result = ParseResult(True, region="A区", street="B街", main="M", mid=["1", "2"])
+    docs = [
+        # 区、街道都一致: 100
+        {"district": "A区", "town": "B街", "f_main": "M", "mid_1": "1", "mid_2": "2"},
+        # 区不一致: -5
+        {"district": "C区", "town": "B街", "f_main": "M", "mid_1": "1", "mid_2": "2"},
+        # 区、街道都不一致: -10
+        {"district": "C区", "town": "D街", "f_main": "M", "mid_1": "1", "mid_2": "2"},
+        # 文档没有区、街道字段, 不减分
+        {"f_main": "M", "mid_1": "1", "mid_2": "2"},
+    ]
+    assert _score(parse_result, docs, calculator) == [100.0, 95.0, 90.0, 100.0]
+
+    # 不是 multi_region 时不比对区、街道
+    assert _score(parse_result, docs) == [100.0, 100.0, 100.0, 100.0]
+
+
+def test_multi_region_without_parsed_region():
+    # 解析不出区的时候按空串比对, 文档有区就减分, 和脚本里 region_value = "" 一致
+    calculator = ScoreCalculator(True, "district", "town")
+    parse_result = ParseResult(True, main="M", mid=["1", "2"])
+    docs = [{"district": "A区", "f_main": "M", "mid_1": "1", "mid_2": "2"}]
+    assert _score(parse_result, docs, calculator) == [95.0]
+
+
+def test_empty_docs():
+    assert len(ScoreCalculator().score(ParseResult(True, main="M"), [])) == 0
+
+
+def test_rerank():
+    parse_result = ParseResult(True, fir=["A"], main="M", mid=["1", "2"])
+    results = [
+        {"id": "1", "f_main": "M", "mid_1": "1"},
+        {"id": "2", "fir_1": "A", "f_main": "M", "mid_1": "1", "mid_2": "2"},
+        {"id": "3", "f_main": "M", "mid_1": "1"},
+    ]
+    ranked = ScoreCalculator().rerank(parse_result, results)
+    # 分数相同的保持原来的顺序
+    assert [result["id"] for result in ranked] == ["2", "1", "3"]
+    assert [result["score"] for result in ranked] == [100.0, 63.0, 63.0]
@@ -0,0 +1,89 @@
+import csv
+import functools
+import io
+
+from sqlalchemy import bindparam, text
+
+
+class BulkWriter:
+    """
+    DataFrame 按主键整行替换（新增或更新）写入数据库。
+    PostgreSQL 用 COPY FROM STDIN (csv) 流式写到临时表, 再 DELETE USING + INSERT; 其他数据库先删再 executemany
+    """
+    CHUNK_SIZE = 5000
+    # 一个 IN 里最多的值个数, 和 CommonTool.split_sql_in_values 一致
+    IN_SIZE = 1000
+
+    @staticmethod
+    def _table_name(pd_table):
+        if pd_table.schema:
+            return f'"{pd_table.schema}"."{pd_table.name}"'
+        return f'"{pd_table.name}"'
+
+    @staticmethod
+    def _copy(cur, table_name, keys, data_iter):
+        buf = io.StringIO()
+        # 空值写成不带引号的空串, COPY csv 会当成 NULL
+        csv.writer(buf).writerows(data_iter)
+        buf.seek(0)
+
+        columns = ", ".join(f'"{k}"' for k in keys)
+        sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        if hasattr(cur, "copy_expert"):
+            # psycopg2
+            cur.copy_expert(sql, buf)
+        else:
+            # psycopg 3
+            with cur.copy(sql) as copy:
+                copy.write(buf.getvalue())
+
+    @staticmethod
+    def upsert_from_stdin(pd_table, conn, keys, data_iter, key="id"):
+        """
+        pandas to_sql 的 method: COPY 到临时表, 再按 key 删掉目标表中已有的行, 从临时表整行插入。
+        和先删再插一样整行替换, 这批数据里没有的列不会保留上次的值
+        """
+        table_name = BulkWriter._table_name(pd_table)
+        tmp_table = f'"tmp_upsert_{pd_table.name}"'
+        columns = ", ".join(f'"{k}"' for k in keys)
+
+        with conn.connection.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {tmp_table} (LIKE {table_name} INCLUDING DEFAULTS)")
+            cur.execute(f"TRUNCATE {tmp_table}")
+            BulkWriter._copy(cur, tmp_table, keys, data_iter)
+            cur.execute(f'DELETE FROM {table_name} t USING {tmp_table} s WHERE t."{key}" = s."{key}"')
+            cur.execute(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {tmp_table}")
+
+    @staticmethod
+    def delete_then_insert(pd_table, conn, keys, data_iter, key="id"):
+        """
+        其他数据库: 同一个事务里先按 key 删掉, 再 executemany 插入。
+        删除的 IN 每次最多 IN_SIZE 个值（Oracle 限制 1000 个）
+        """
+        data = [dict(zip(keys, row)) for row in data_iter]
+        if len(data) == 0:
+            return
+        sql = text(f"DELETE FROM {BulkWriter._table_name(pd_table)} WHERE {key} IN :ids")
+        sql = sql.bindparams(bindparam("ids", expanding=True))
+        ids = [row[key] for row in data]
+        for i in range(0, len(ids), BulkWriter.IN_SIZE):
+            conn.execute(sql, {"ids": ids[i:i + BulkWriter.IN_SIZE]})
+        conn.execute(pd_table.table.insert(), data)
+
+    @staticmethod
+    def upsert_df(df, table, con, key="id"):
+        """
+        按 key 新增或更新。 同一批里 key 重复的只保留最后一条
+        :param con: engine 或 connection, 传 connection 时在调用方的事务里写入, 由调用方提交
+        """
+        df = df.drop_duplicates(subset=[key], keep="last")
+        if con.dialect.name == "postgresql":
+            method = functools.partial(BulkWriter.upsert_from_stdin, key=key)
+        else:
+            method = functools.partial(BulkWriter.delete_then_insert, key=key)
+        df.to_sql(table,
+                  con,
+                  if_exists="append",
+                  index=False,
+                  chunksize=BulkWriter.CHUNK_SIZE,
+                  method=method)
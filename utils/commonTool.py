@@ -12,6 +12,10 @@ class CommonTool:
     # ES_LONG_MAX = 9223372036854775807
     ES_NUMBER_MAX = 4294967296  # 2的32次方
 
+    # 全角转半角的转换表: 全角空格 -> 半角空格, 其他全角字符 = 半角字符 + 0xfee0
+    FULL_TO_HALF_TABLE = {0x3000: 0x20} | {code: code - 0xfee0 for code in range(0xFF01, 0xFF5F)}
+    _SPACES_PATTERN = re.compile(r'\s+')
+
     @staticmethod
     def has_chinese_characters(s):
         """
@@ -215,6 +219,18 @@ class CommonTool:
         # 将numpy数组转换回DataFrame
         return [pd.DataFrame(chunk, columns=df.columns) for chunk in chunks]
 
+    @staticmethod
+    def split_sql_in_values(values, size=1000):
+        """
+        分批转成 sql 中 in 的值: 'a','b','c' (oracle 的 in 最多1000个)
+        :param values:
+        :param size: 每批的个数
+        :return:
+        """
+        values = list(values)
+        for i in range(0, len(values), size):
+            yield ",".join("'" + str(v).replace("'", "''") + "'" for v in values[i:i + size])
+
     @staticmethod
     def write_pid(file_name, pid):
         with open(file_name, mode="w") as file:
@@ -227,16 +243,7 @@ class CommonTool:
         :param s: 输入的全角字符串
         :return: 转换后的半角字符串
         """
-        # 全角空格转换为半角空格
-        s = s.replace('　', ' ')
-        # 转换其他全角字符（根据Unicode编码范围进行转换）
-        res = ''
-        for char in s:
-            if '\uFF01' <= char <= '\uFF5E':  # 全角字符范围
-                # 半角字符 = 全角字符 - 0xfee0
-                char = chr(ord(char) - 0xfee0)
-            res += char
-        return res
+        return s.translate(CommonTool.FULL_TO_HALF_TABLE)
 
     @staticmethod
     def remove_spaces(s):
@@ -246,5 +253,5 @@ class CommonTool:
         :return: 所有空格移除后的字符串
         """
         # 使用正则表达式匹配并替换掉所有空格字符
-        return re.sub(r'\s+', '', s)
+        return CommonTool._SPACES_PATTERN.sub('', s)
 
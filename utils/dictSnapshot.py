@@ -0,0 +1,52 @@
+import threading
+
+
+class DictSnapshot:
+    """
+    LAC自定义字典的只读快照。 字典重新加载后生成新的快照整体替换，所有线程共用
+    """
+    __version_lock = threading.Lock()
+    __last_version = 0
+
+    def __init__(self, dictitem=None):
+        # 内容和快照一致的字典对象。 LAC模型从池里取, 每个模型有自己的字典对象, 内容是一样的
+        self.__sources = [dictitem] if dictitem is not None else []
+        self.__size = len(dictitem) if dictitem is not None else 0
+        self.__words = self.__keys(dictitem)
+        with DictSnapshot.__version_lock:
+            DictSnapshot.__last_version += 1
+            self.__version = DictSnapshot.__last_version
+
+    @staticmethod
+    def __keys(dictitem):
+        return frozenset(dictitem.keys() if hasattr(dictitem, "keys") else (dictitem or ()))
+
+    @property
+    def words(self):
+        return self.__words
+
+    @property
+    def version(self):
+        return self.__version
+
+    def __contains__(self, word):
+        return word in self.__words
+
+    def __len__(self):
+        return len(self.__words)
+
+    def is_stale(self, dictitem):
+        """
+        字典内容变了, 就需要重新生成快照。
+        每个字典对象只在第一次遇到时比较一次内容, 之后只比较大小
+        """
+        if dictitem is None:
+            return len(self.__words) > 0
+        if len(dictitem) != self.__size:
+            return True
+        if any(dictitem is source for source in self.__sources):
+            return False
+        if self.__keys(dictitem) != self.__words:
+            return True
+        self.__sources.append(dictitem)
+        return False
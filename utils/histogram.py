@@ -0,0 +1,51 @@
+import bisect
+
+
+class Histogram:
+    """
+    固定分桶的直方图, 用于统计耗时等数值。 非线程安全, 由调用方加锁
+    """
+    # 默认分桶的上限，单位毫秒
+    DEFAULT_BOUNDS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self._bounds = tuple(bounds)
+        # 最后一个桶是超过最大上限的
+        self._buckets = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def observe(self, value, count=1):
+        self._buckets[bisect.bisect_left(self._bounds, value)] += count
+        self._count += count
+        self._sum += value * count
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, p):
+        """
+        按分桶估算百分位（返回所在桶的上限）
+        """
+        if self._count == 0:
+            return 0.0
+        target = self._count * p / 100.0
+        total = 0
+        for i, n in enumerate(self._buckets):
+            total += n
+            if total >= target:
+                return self._bounds[i] if i < len(self._bounds) else self._max
+        return self._max
+
+    def to_dict(self):
+        buckets = {("<=" + str(b)): n for b, n in zip(self._bounds, self._buckets)}
+        buckets[">" + str(self._bounds[-1])] = self._buckets[-1]
+        return {
+            "count": self._count,
+            "avg": round(self._sum / self._count, 3) if self._count > 0 else 0.0,
+            "max": round(self._max, 3),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": buckets
+        }
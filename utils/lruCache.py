@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LruCache:
+    """
+    线程安全的 LRU 缓存, 可选过期时间。 max_size <= 0 表示不缓存
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+        self._max_size = max_size
+        # 过期时间, 单位秒, None 为不过期
+        self._ttl = ttl if ttl is not None and ttl > 0 else None
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._ttl is not None and time.monotonic() - entry[1] > self._ttl:
+                del self._data[key]
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "max_size": self._max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total > 0 else 0.0
+            }
@@ -0,0 +1,79 @@
+from addressSearch.utils.lruCache import LruCache
+
+
+class SegmentCache(LruCache):
+    """
+    进程内共享的分词结果缓存 (LRU, 线程安全)
+    """
+
+    def __init__(self, max_size=10000):
+        super().__init__(max_size)
+
+
+class SegmentMemo:
+    """
+    包装LAC模型, 一个地址解析过程中同样的字符串只分词一次。
+    返回的是拷贝，调用方可以随意修改（比如 removeBigRegions 会直接 pop）
+    """
+
+    def __init__(self, model, shared_cache: SegmentCache = None):
+        self._model = model
+        self._shared_cache = shared_cache if shared_cache is not None and shared_cache.enabled else None
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+        # 实际调用LAC的次数
+        self.lac_calls = 0
+
+    @property
+    def model(self):
+        # 兼容 model.model.custom.dictitem 的写法
+        return self._model.model
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "lac_calls": self.lac_calls}
+
+    def _lookup(self, text):
+        value = self._memo.get(text)
+        if value is None and self._shared_cache is not None:
+            value = self._shared_cache.get(text)
+            if value is not None:
+                self._memo[text] = value
+        return value
+
+    def _store(self, text, result):
+        value = (tuple(result[0]), tuple(result[1]))
+        self._memo[text] = value
+        if self._shared_cache is not None:
+            self._shared_cache.put(text, value)
+        return value
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), list(value[1])]
+
+    def run(self, texts):
+        """
+        和 LAC.run 一样, 可以传字符串或字符串列表
+        """
+        if isinstance(texts, str):
+            value = self._lookup(texts)
+            if value is None:
+                self.misses += 1
+                self.lac_calls += 1
+                value = self._store(texts, self._model.run(texts))
+            else:
+                self.hits += 1
+            return self._copy(value)
+
+        # 列表的话, 没命中的一起交给LAC批量分词
+        values = [self._lookup(text) for text in texts]
+        missed = list(dict.fromkeys(text for text, value in zip(texts, values) if value is None))
+        self.hits += len(texts) - sum(1 for value in values if value is None)
+        self.misses += sum(1 for value in values if value is None)
+        if len(missed) > 0:
+            self.lac_calls += 1
+            for text, result in zip(missed, self._model.run(missed)):
+                self._store(text, result)
+        return [self._copy(self._memo[text]) for text in texts]
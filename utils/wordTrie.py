@@ -0,0 +1,99 @@
+class WordTrie:
+    """
+    前缀树, 用于在字符串中最长匹配词表中的词（省、市、区、街道、同义词等）
+    """
+    __END = ""
+
+    def __init__(self, words=None):
+        self.__root = {}
+        self.__size = 0
+        if words is not None:
+            for word in words:
+                self.add(word)
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, word):
+        if word is None or word == "":
+            return
+        node = self.__root
+        for char in word:
+            node = node.setdefault(char, {})
+        if self.__END not in node:
+            node[self.__END] = word
+            self.__size += 1
+
+    def longest_prefix(self, s: str, start=0):
+        """
+        从 start 位置开始，最长匹配的词
+        :param s:
+        :param start:
+        :return: 匹配到的词, 没有则返回None
+        """
+        node = self.__root
+        found = None
+        for i in range(start, len(s)):
+            node = node.get(s[i])
+            if node is None:
+                break
+            if self.__END in node:
+                found = node[self.__END]
+        return found
+
+    def iter_matches(self, s: str):
+        """
+        找出字符串中所有出现的词（可重叠）
+        :param s:
+        :return: (开始位置, 词)
+        """
+        for start in range(len(s)):
+            node = self.__root
+            for i in range(start, len(s)):
+                node = node.get(s[i])
+                if node is None:
+                    break
+                if self.__END in node:
+                    yield start, node[self.__END]
+
+    def strip_prefix(self, s: str, repeat=False):
+        """
+        去掉开头最长匹配的词
+        :param s:
+        :param repeat: 是否一直去掉，直到开头没有匹配的词
+        :return: 去掉后的字符串, 去掉的词列表
+        """
+        removed = []
+        while True:
+            word = self.longest_prefix(s)
+            if word is None:
+                break
+            s = s[len(word):]
+            removed.append(word)
+            if not repeat:
+                break
+        return s, removed
+
+    def remove_all(self, s: str):
+        """
+        从左到右最长匹配，去掉字符串中所有的词。去掉后可能拼出新的词，所以一直处理到不再变化
+        :param s:
+        :return:
+        """
+        if self.__size == 0:
+            return s
+
+        while True:
+            chars = []
+            i = 0
+            while i < len(s):
+                word = self.longest_prefix(s, i)
+                if word is None:
+                    chars.append(s[i])
+                    i += 1
+                else:
+                    i += len(word)
+            result = "".join(chars)
+            if result == s:
+                return result
+            s = result